@@ -0,0 +1,45 @@
+from time import perf_counter
+from random import sample, seed
+from causality import CausalGraph
+
+# Random DAG with 2000 nodes and 12000 edges
+seed(0)
+n_nodes = 2000
+n_edges = 12000
+nodes = ["V" + str(i) for i in range(n_nodes)]
+graph = CausalGraph()
+for node in nodes:
+    graph.add_node(node)
+while len(graph.edges()) < n_edges:
+    i, j = sorted(sample(range(n_nodes), 2))
+    graph.add_edge(nodes[i], nodes[j])
+
+# Previous implementation, scanning the full edge list for every member of X
+def children_edge_scan(graph, X):
+    return set().union(*(set(edge[1] for edge in graph.edges() if edge[0] == x) for x in X))
+
+def parents_edge_scan(graph, X):
+    return set().union(*(set(edge[0] for edge in graph.edges() if edge[1] == x) for x in X))
+
+queries = [{node} for node in sample(nodes, 200)]
+
+for name, method, reference in [
+        ("children", graph.children, lambda X: children_edge_scan(graph, X)),
+        ("parents", graph.parents, lambda X: parents_edge_scan(graph, X))]:
+    start = perf_counter()
+    expected = [reference(X) for X in queries]
+    time_scan = perf_counter() - start
+
+    start = perf_counter()
+    result = [method(X) for X in queries]
+    time_index = perf_counter() - start
+
+    assert result == expected
+    print("{} ({} queries, {} edges): edge scan {:.3f}s, index {:.5f}s, speedup x{:.0f}".format(
+        name, len(queries), n_edges, time_scan, time_index, time_scan / time_index))
+
+start = perf_counter()
+for X in queries:
+    graph.ancestors(X)
+    graph.descendants(X)
+print("ancestors + descendants ({} queries): {:.3f}s".format(len(queries), perf_counter() - start))
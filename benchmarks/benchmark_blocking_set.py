@@ -0,0 +1,70 @@
+from time import perf_counter
+from random import sample, seed
+from causality import CausalGraph
+from causality.identification import blocking_set
+from causality.random_system import generate_linear_system
+
+# Previous implementation of closure, enumerating every undirected path from
+# every member of X to every member of A
+def closure_path_enumeration(graph: CausalGraph, X, A, Z):
+    res = X.copy()
+    for x in X:
+        for a in A.difference(X):
+            for path in graph.all_undirected_paths(x, a):
+                valid_path = True
+                for i, v in enumerate(path[1:-1]):
+                    if v not in A:
+                        valid_path = False
+                    if v in Z and not graph.is_collider(path[i-1], v, path[i + 1]):
+                        valid_path = False
+                if valid_path:
+                    res.add(a)
+                    break
+    return res
+
+def blocking_set_path_enumeration(graph: CausalGraph, X, Y, U = set(), always_included = set()):
+    R = set(graph.nodes()).difference(U)
+    A = graph.ancestors(X.union(Y).union(always_included))
+    Z_0 = R.intersection(A.difference(X.union(Y)))
+    X_star = closure_path_enumeration(graph, X, A, Z_0)
+    Z_X = Z_0.intersection(X_star.union(always_included))
+    Y_star = closure_path_enumeration(graph, Y, A, Z_X)
+    if not X_star.isdisjoint(Y):
+        return None
+    else:
+        return Z_X.intersection(Y_star.union(always_included))
+
+seed(0)
+n_queries = 5
+# The path enumeration is exponential in time and memory (it already needs
+# minutes and gigabytes around 60 nodes), so it is skipped for all larger
+# graphs once it exceeds this number of seconds
+time_limit = 1
+run_path_enumeration = True
+
+for n_nodes in [20, 30, 40, 50, 100, 200, 500, 1000]:
+    graph = generate_linear_system(
+        n_nodes=n_nodes,
+        n_edges=int(1.2 * n_nodes),
+        min_mu=0, max_mu=0,
+        min_sigma=1, max_sigma=1,
+        min_rho=1, max_rho=1
+    )
+    queries = [sample(graph.nodes(), 2) for _ in range(n_queries)]
+
+    start = perf_counter()
+    for x, y in queries:
+        blocking_set(graph, {x}, {y})
+    time_linear = perf_counter() - start
+
+    if run_path_enumeration:
+        start = perf_counter()
+        for x, y in queries:
+            blocking_set_path_enumeration(graph, {x}, {y})
+        time_paths = perf_counter() - start
+        run_path_enumeration = time_paths < time_limit
+        print("{} nodes ({} queries): path enumeration {:.3f}s, linear {:.4f}s, speedup x{:.0f}".format(
+            n_nodes, n_queries, time_paths, time_linear, time_paths / time_linear))
+    else:
+        print("{} nodes ({} queries): path enumeration skipped, linear {:.4f}s".format(
+            n_nodes, n_queries, time_linear))
@@ -0,0 +1,34 @@
+from time import perf_counter
+from random import seed
+import numpy as np
+from causality import CausalGraph
+from causality.discovery import ges_algorithm, pdag_to_cpdag
+from causality.gaussian import GaussianBICScore
+from causality.random_system import generate_linear_system, sample_linear_system
+
+# Random linear Gaussian system with 200 nodes and 300 edges
+seed(0)
+np.random.seed(0)
+n_nodes = 200
+n_edges = 300
+graph = generate_linear_system(n_nodes, n_edges, 0, 0, 0.5, 1, 0.5, 1)
+data = sample_linear_system(graph, 5000)
+nodes = graph.nodes()
+expected = pdag_to_cpdag(graph)
+expected_skeleton = {frozenset((b, e)) for b, e, _ in expected.edges()}
+
+for n_jobs in [1, 4]:
+    score = GaussianBICScore(data, nodes)
+    initial_graph = CausalGraph()
+    for node in nodes:
+        initial_graph.add_node(node)
+
+    start = perf_counter()
+    res = ges_algorithm(data, score, initial_graph=initial_graph, n_jobs=n_jobs, backend="process")
+    duration = perf_counter() - start
+
+    res_skeleton = {frozenset((b, e)) for b, e, _ in res.edges()}
+    print("GES ({} nodes, {} edges, {} jobs): {:.2f}s, {} missing and {} extra adjacencies".format(
+        n_nodes, n_edges, n_jobs, duration, len(expected_skeleton - res_skeleton),
+        len(res_skeleton - expected_skeleton)))
+    print("    local score cache:", score.local_score_cache.stats())
@@ -0,0 +1,41 @@
+from time import perf_counter
+import random
+import numpy as np
+from causality import CausalGraph
+from causality.random_system import generate_linear_system, sample_linear_system
+from causality.gaussian import GaussianIndependenceTest
+from causality.discovery import pc_algorithm, IncrementalPC
+
+# Linear Gaussian system with 60 nodes and 90 edges, learned on 50000 rows
+# then updated with batches of 2000 rows. Each update is compared with a
+# cold run of stable PC on all the rows received so far
+random.seed(0)
+np.random.seed(0)
+graph = generate_linear_system(60, 90, 0, 0, 0.5, 1, 0.5, 1)
+nodes = graph.nodes()
+n_initial = 50000
+batch_size = 2000
+n_batches = 5
+data = sample_linear_system(graph, n_initial + n_batches * batch_size)
+
+start = perf_counter()
+incremental = IncrementalPC(GaussianIndependenceTest(data[:n_initial], nodes), 0.05, nodes)
+print("initial search: {:.2f}s, {} tests".format(perf_counter() - start, len(incremental.tests)))
+
+for k in range(n_batches):
+    end = n_initial + (k + 1) * batch_size
+    start = perf_counter()
+    replayed = incremental.update(data[end - batch_size:end])
+    update = perf_counter() - start
+
+    initial_graph = CausalGraph()
+    for node in nodes:
+        initial_graph.add_node(node)
+    start = perf_counter()
+    expected = pc_algorithm(data[:end], GaussianIndependenceTest(data[:end], nodes), 0.05,
+                            initial_graph=initial_graph.complete().copy(), stable=True)
+    cold = perf_counter() - start
+
+    assert sorted(incremental.graph.edges()) == sorted(expected.edges())
+    print("{} rows: update {:.3f}s ({} p-values computed, {}), cold run {:.3f}s".format(
+        end, update, incremental.computed, "replayed" if replayed else "unchanged", cold))
@@ -0,0 +1,36 @@
+from time import perf_counter
+from random import sample, seed
+from causality import CausalGraph
+from causality.d_separation import DSeparationOracle
+from causality.discovery import pc_algorithm
+
+# Sparse random DAG with 500 nodes and 500 edges, the tests are answered by
+# d-separation so that only the cost of the search itself is measured. On
+# denser graphs the number of tests made by PC explodes
+seed(0)
+n_nodes = 500
+n_edges = 500
+nodes = ["V" + str(i) for i in range(n_nodes)]
+graph = CausalGraph()
+for node in nodes:
+    graph.add_node(node)
+while len(graph.edges()) < n_edges:
+    i, j = sorted(sample(range(n_nodes), 2))
+    graph.add_edge(nodes[i], nodes[j])
+
+for stable in [False, True]:
+    oracle = DSeparationOracle(graph)
+    initial_graph = CausalGraph()
+    for node in nodes:
+        initial_graph.add_node(node)
+    initial_graph = initial_graph.complete().copy()
+
+    start = perf_counter()
+    res = pc_algorithm(None, oracle, 0.5, initial_graph=initial_graph, stable=stable)
+    duration = perf_counter() - start
+
+    n_tests = sum(oracle.query_sizes.values())
+    print("{} PC ({} nodes, {} edges): {:.2f}s, {} tests ({:.0f} tests/s), {} reachability passes".format(
+        "stable" if stable else "original", n_nodes, n_edges, duration, n_tests, n_tests / duration,
+        oracle.cache.misses))
+    print("    tests per conditioning set size:", dict(sorted(oracle.query_sizes.items())))
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from sys import getsizeof
+import numpy as np
+
+
+def _sizeof(obj) -> int:
+    """Approximate memory used by a cache key or value, in bytes."""
+    if isinstance(obj, np.ndarray):
+        return getsizeof(obj) + (0 if obj.base is None else obj.nbytes)
+    if isinstance(obj, tuple):
+        return getsizeof(obj) + sum(_sizeof(o) for o in obj)
+    return getsizeof(obj)
+
+
+class BoundedCache:
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        """Dict-like cache evicting the least recently used entries once
+        it holds more than `max_entries` entries or more than `max_bytes`
+        bytes (as estimated by `sys.getsizeof`). None means no limit.
+
+        The counters `hits`, `misses` and `evictions` can be read to size
+        the cache.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the cached value of `key` and marks it as recently used,
+        or returns `default`. Counts a hit or a miss.
+        """
+        try:
+            value, _ = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        size = _sizeof(key) + _sizeof(value)
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while len(self._entries) > 1 and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries)
+                or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,169 @@
+from typing import Mapping, Sequence
+import numpy as np
+from scipy.stats import chi2
+from causality.cache import BoundedCache
+
+
+class CategoricalIndependenceTest:
+    def __init__(
+            self,
+            data_matrix: np.ndarray,
+            column_names: Sequence[str],
+            method: str = "chi2",
+            cache_entries: int = 1024,
+            max_cells: int = 2**18):
+        """Conditional independence test of discrete variables, with the
+        same interface as `GaussianIndependenceTest`.
+
+        Every column is integer-coded once. The conditioning set K is coded
+        as one stratum index per sample (a mixed-radix code of the columns
+        of K, renumbered to the non-empty strata), and cached. The
+        stratified contingency tables of (K, i, j) of many pairs (i, j)
+        with the same numbers of levels are stacked and counted with one
+        `np.bincount`, and their statistics are computed together.
+
+        :param data_matrix: array of shape (n_samples, n_columns) of
+            discrete values
+        :param column_names: the name of every column
+        :param method: "chi2" for Pearson's chi-square test, or "g" for the
+            G-test (likelihood ratio)
+        :param cache_entries: maximal number of cached strata
+        :param max_cells: maximal number of codes (samples times tables) or
+            of cells counted by one call to `np.bincount` in
+            `indep_test_many`
+        """
+        if method not in ("chi2", "g"):
+            raise ValueError("Unknown method " + str(method))
+        self.method = method
+        self.max_cells = max_cells
+        self.inv_names = {name: i for i, name in enumerate(column_names)}
+        self.n = data_matrix.shape[0]
+        self.n_levels = []
+        self.codes = []
+        for i in range(data_matrix.shape[1]):
+            levels, codes = np.unique(data_matrix[:, i], return_inverse=True)
+            self.n_levels.append(len(levels))
+            self.codes.append(codes.reshape(-1).astype(np.int64))
+        # Keys are sorted tuples of column indices
+        self.strata_cache = BoundedCache(cache_entries)
+
+    @classmethod
+    def from_columns(cls, columns: Mapping[object, np.ndarray], **kwargs):
+        """Builds the test from a dict `{variable: array}`, such as the
+        samples of `CausalModel.rvs`. Variables are named with `str`.
+        Other keyword arguments are passed to the constructor.
+        """
+        names = [str(var) for var in columns]
+        return cls(np.column_stack(list(columns.values())), names, **kwargs)
+
+    def strata(self, K: tuple) -> tuple[np.ndarray, int]:
+        """Stratum index of every sample for the sorted column indices K,
+        and the number of strata.
+        """
+        res = self.strata_cache.get(K)
+        if res is not None:
+            return res
+        code = np.zeros(self.n, dtype=np.int64)
+        n_strata = 1
+        for k in K:
+            code = code * self.n_levels[k] + self.codes[k]
+            n_strata *= self.n_levels[k]
+            if n_strata > self.n:
+                # Renumber the strata to keep the codes small
+                _, code = np.unique(code, return_inverse=True)
+                n_strata = int(code.max()) + 1
+        if len(K) > 0:
+            # Only keep the strata actually observed
+            _, code = np.unique(code, return_inverse=True)
+            code = code.reshape(-1)
+            n_strata = int(code.max()) + 1
+        res = (code, n_strata)
+        self.strata_cache[K] = res
+        return res
+
+    def contingency_tables(self, pairs: Sequence[tuple], K: tuple) -> np.ndarray:
+        """Tables of counts of shape (len(pairs), n_strata, ri, rj) of
+        pairs of columns (i, j) which all have ri and rj levels, counted
+        with one `np.bincount`.
+        """
+        code, n_strata = self.strata(K)
+        ri, rj = self.n_levels[pairs[0][0]], self.n_levels[pairs[0][1]]
+        size = n_strata * ri * rj
+        # Codes of the strata of (K, i), shared by the pairs of i
+        left = {i: code * ri + self.codes[i] for i in dict.fromkeys(i for i, _ in pairs)}
+        combined = np.empty((len(pairs), self.n), dtype=np.int64)
+        for p, (i, j) in enumerate(pairs):
+            np.multiply(left[i], rj, out=combined[p])
+            combined[p] += self.codes[j]
+            combined[p] += p * size
+        return np.bincount(combined.reshape(-1), minlength=len(pairs) * size) \
+            .reshape(len(pairs), n_strata, ri, rj)
+
+    def contingency_table(self, i: int, j: int, K: tuple) -> np.ndarray:
+        """Table of counts of shape (n_strata, n_levels[i], n_levels[j])."""
+        return self.contingency_tables([(i, j)], K)[0]
+
+    def statistics(self, observed: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Test statistics and degrees of freedom of stacked tables of
+        counts of shape (m, n_strata, ri, rj).
+        """
+        margin_i = observed.sum(axis=3)
+        margin_j = observed.sum(axis=2)
+        totals = margin_i.sum(axis=2)[:, :, None, None]
+        expected = np.divide(margin_i[:, :, :, None] * margin_j[:, :, None, :], totals,
+                             out=np.zeros(observed.shape), where=totals > 0)
+        if self.method == "chi2":
+            terms = np.divide((observed - expected)**2, expected,
+                              out=np.zeros(observed.shape), where=expected > 0)
+        else:
+            # Expected counts are positive where observed counts are
+            ratio = np.divide(observed, expected, out=np.ones(observed.shape), where=observed > 0)
+            terms = 2 * observed * np.log(ratio)
+        # Levels that never appear in a stratum do not count in its degrees
+        # of freedom
+        rows = np.count_nonzero(margin_i, axis=2)
+        cols = np.count_nonzero(margin_j, axis=2)
+        dofs = np.sum(np.maximum(rows - 1, 0) * np.maximum(cols - 1, 0), axis=1)
+        return terms.sum(axis=(1, 2, 3)), dofs
+
+    def statistic(self, i: int, j: int, K: tuple) -> tuple[float, int]:
+        """Test statistic and degrees of freedom of the independence of the
+        columns i and j given the sorted column indices K.
+        """
+        stats, dofs = self.statistics(self.contingency_tables([(i, j)], K))
+        return float(stats[0]), int(dofs[0])
+
+    def _indices(self, i: str, j: str, K: Sequence[str]):
+        return self.inv_names[i], self.inv_names[j], tuple(sorted(self.inv_names[k] for k in K))
+
+    def indep_test(self, i: str, j: str, K: Sequence[str]) -> float:
+        stat, dof = self.statistic(*self._indices(i, j, K))
+        if dof == 0:
+            return 1.0
+        return float(chi2.sf(stat, dof))
+
+    def indep_test_many(self, tests: Sequence[tuple]) -> np.ndarray:
+        """p-values of a sequence of triples (i, j, K), like `indep_test`.
+        The tests sharing a conditioning set and the numbers of levels of i
+        and j are counted with one `np.bincount` and their statistics
+        computed on the stacked tables, by chunks of about `max_cells`
+        codes. The p-values are computed with one call to `chi2.sf`.
+        """
+        groups = {}
+        for t, test in enumerate(tests):
+            i, j, K = self._indices(*test)
+            groups.setdefault((K, self.n_levels[i], self.n_levels[j]), []).append((t, (i, j)))
+        stats = np.zeros(len(tests))
+        dofs = np.zeros(len(tests))
+        for (K, ri, rj), group in groups.items():
+            _, n_strata = self.strata(K)
+            chunk_size = max(1, self.max_cells // max(self.n, n_strata * ri * rj))
+            for start in range(0, len(group), chunk_size):
+                chunk = group[start:start + chunk_size]
+                positions = [t for t, _ in chunk]
+                observed = self.contingency_tables([pair for _, pair in chunk], K)
+                stats[positions], dofs[positions] = self.statistics(observed)
+        res = np.ones(len(tests))
+        positive = dofs > 0
+        res[positive] = chi2.sf(stats[positive], dofs[positive])
+        return res
@@ -1,33 +1,222 @@
 from graph import Graph
+from causality.d_separation import DSeparationIndex
+
+
+def _bits(bitset):
+    """Indices of the bits set in the integer `bitset`."""
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+class _ClosureIndex:
+    """Transitive closure of a `CausalGraph`, stored as one bitset (a Python
+    int) of ancestor indices and one of descendant indices per node index.
+    A node is its own ancestor and descendant.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.ancestors = [0] * len(graph._index_node)
+        self.descendants = [0] * len(graph._index_node)
+        indices = sum(1 << i for i in graph._node_index.values())
+        self._recompute(indices, self.descendants, graph._succ, graph._pred)
+        self._recompute(indices, self.ancestors, graph._pred, graph._succ)
+
+    def add_node(self, i):
+        if i == len(self.ancestors):
+            self.ancestors.append(0)
+            self.descendants.append(0)
+        self.ancestors[i] = 1 << i
+        self.descendants[i] = 1 << i
+
+    def del_node(self, i):
+        # The edges of the node have already been removed
+        self.ancestors[i] = 0
+        self.descendants[i] = 0
+
+    def add_edge(self, i, j):
+        if self.descendants[i] >> j & 1:
+            # j was already a descendant of i, nothing changes
+            return
+        ancestors_i = self.ancestors[i]
+        descendants_j = self.descendants[j]
+        for a in _bits(ancestors_i):
+            self.descendants[a] |= descendants_j
+        for d in _bits(descendants_j):
+            self.ancestors[d] |= ancestors_i
+
+    def del_edge(self, i, j):
+        # Only the ancestors of i can lose descendants, and only the
+        # descendants of j can lose ancestors
+        graph = self.graph
+        self._recompute(self.ancestors[i], self.descendants, graph._succ, graph._pred)
+        self._recompute(self.descendants[j], self.ancestors, graph._pred, graph._succ)
+
+    def _recompute(self, affected, closure, adjacency, reverse):
+        """Recomputes `closure[i]` for the indices i in the bitset
+        `affected`, following the edges in `adjacency`. The closure of the
+        other nodes must be up to date.
+        """
+        affected = list(_bits(affected))
+        # Process a node once all its affected successors are processed
+        # (reverse topological order within the affected nodes)
+        pending = {i: 0 for i in affected}
+        for i in affected:
+            for j in adjacency[i]:
+                if j in pending:
+                    pending[i] += 1
+        stack = [i for i in affected if pending[i] == 0]
+        while len(stack) > 0:
+            i = stack.pop()
+            del pending[i]
+            res = 1 << i
+            for j in adjacency[i]:
+                res |= closure[j]
+            closure[i] = res
+            for k in reverse[i]:
+                if k in pending:
+                    pending[k] -= 1
+                    if pending[k] == 0:
+                        stack.append(k)
+        # The remaining nodes are on a cycle, fall back to a graph walk
+        for i in pending:
+            closure[i] = sum(1 << j for j in self.graph._reach([i], adjacency))
+
 
 class CausalGraph(Graph):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, closure_index=False, **kwargs):
+        """Constructor.
+
+        :param closure_index: if True, maintain the transitive closure of
+            the graph as bitsets, so that `ancestors` and `descendants` do
+            not walk the graph. Edge updates then cost more.
+        Other arguments are passed to `graph.Graph`.
+        """
+        # Integer-indexed adjacency, kept in sync by the overridden mutators.
+        # It must exist before Graph.__init__ adds the nodes and edges.
+        self._node_index = {}
+        self._index_node = []
+        self._free_indices = []
+        self._succ = []
+        self._pred = []
+        self._closure = None
+        self._version = 0
         super().__init__(*args, **kwargs)
-        self._undirected = None
-        self._complete = None
+        self._clear_caches()
+        if closure_index:
+            self._closure = _ClosureIndex(self)
     
-    def add_edge(self, *args, **kwargs):
-        self._undirected = None
-        self._complete = None
-        super().add_edge(*args, **kwargs)
+    def add_edge(self, node1, node2, value=1, bidirectional=False):
+        self._clear_caches()
+        # Graph.add_edge adds the missing nodes through self.add_node
+        super().add_edge(node1, node2, value, bidirectional)
+        i, j = self._node_index[node1], self._node_index[node2]
+        if j not in self._succ[i]:
+            self._succ[i].add(j)
+            self._pred[j].add(i)
+            if self._closure is not None:
+                self._closure.add_edge(i, j)
     
-    def del_edge(self, *args, **kwargs):
-        self._undirected = None
-        self._complete = None
-        super().del_edge(*args, **kwargs)
+    def del_edge(self, node1, node2):
+        self._clear_caches()
+        super().del_edge(node1, node2)
+        if node1 in self._node_index and node2 in self._node_index:
+            i, j = self._node_index[node1], self._node_index[node2]
+            if j in self._succ[i]:
+                self._succ[i].remove(j)
+                self._pred[j].remove(i)
+                if self._closure is not None:
+                    self._closure.del_edge(i, j)
     
-    def add_node(self, *args, **kwargs):
-        self._undirected = None
-        self._complete = None
-        super().add_node(*args, **kwargs)
+    def add_node(self, node_id, obj=None):
+        self._clear_caches()
+        super().add_node(node_id, obj)
+        if node_id not in self._node_index:
+            if len(self._free_indices) > 0:
+                i = self._free_indices.pop()
+                self._index_node[i] = node_id
+            else:
+                i = len(self._index_node)
+                self._index_node.append(node_id)
+                self._succ.append(set())
+                self._pred.append(set())
+            self._node_index[node_id] = i
+            if self._closure is not None:
+                self._closure.add_node(i)
     
-    def del_node(self, *args, **kwargs):
+    def del_node(self, node_id):
+        self._clear_caches()
+        # Graph.del_node removes the edges through self.del_edge
+        super().del_node(node_id)
+        if node_id in self._node_index:
+            i = self._node_index.pop(node_id)
+            self._index_node[i] = None
+            self._free_indices.append(i)
+            if self._closure is not None:
+                self._closure.del_node(i)
+
+    def _clear_caches(self):
+        self._d_separation = None
         self._undirected = None
         self._complete = None
-        super().del_node(*args, **kwargs)
+        self._views = {}
+        self._version += 1
+
+    @property
+    def version(self):
+        """Counter incremented by every modification of the graph, to key
+        cached results.
+        """
+        return self._version
+
+    def _indices(self, X):
+        """Indices of the members of X that are nodes of the graph."""
+        return [self._node_index[x] for x in X if x in self._node_index]
+
+    def _nodes_of(self, indices):
+        return {self._index_node[i] for i in indices}
+
+    def _reach(self, indices, adjacency):
+        """Indices reachable from `indices` in the index-based `adjacency`
+        (either `self._succ` or `self._pred`), with `indices` included.
+        """
+        res = set(indices)
+        stack = list(res)
+        while len(stack) > 0:
+            for j in adjacency[stack.pop()]:
+                if j not in res:
+                    res.add(j)
+                    stack.append(j)
+        return res
+
+    def _descendant_indices(self, indices):
+        if self._closure is None:
+            return self._reach(indices, self._succ)
+        return set(_bits(self._closure_union(indices, self._closure.descendants)))
+
+    def _ancestor_indices(self, indices):
+        if self._closure is None:
+            return self._reach(indices, self._pred)
+        return set(_bits(self._closure_union(indices, self._closure.ancestors)))
+
+    def _closure_union(self, indices, closure):
+        res = 0
+        for i in indices:
+            res |= closure[i]
+        return res
+
+    def use_closure_index(self, enabled=True):
+        """Starts or stops maintaining the transitive closure bitsets (see
+        the `closure_index` parameter of the constructor).
+        """
+        if enabled and self._closure is None:
+            self._closure = _ClosureIndex(self)
+        elif not enabled:
+            self._closure = None
         
     def copy(self):
-        return CausalGraph(from_dict=self.to_dict())
+        return CausalGraph(from_dict=self.to_dict(), closure_index=self._closure is not None)
 
     def undirected(self):
         """Returns a copy of the graph with all edges duplicated in the opposite
@@ -84,7 +273,7 @@ class CausalGraph(Graph):
 
     def is_directed(self, x, y):
         """True if x -> y and not x <- y."""
-        return self.edge(x, y) is not None and self.edge(y, x) is not None
+        return self.edge(x, y) is not None and self.edge(y, x) is None
 
     def undirected_neighbors(self, X):
         """List all nodes adjacent to X but only with undirected edges."""
@@ -92,76 +281,220 @@ class CausalGraph(Graph):
 
     def children(self, X):
         """Direct children of all members of X."""
-        # the from_node parameter in graph.edges does not seem to work here
-        return set().union(*(set(edge[1] for edge in self.edges() if edge[0] == x) for x in X))
+        return self._nodes_of(j for i in self._indices(X) for j in self._succ[i])
 
     def parents(self, X):
         """Direct parents of all members of X."""
-        # the to_node parameter in graph.edges does not seem to work here
-        return set().union(*(set(edge[0] for edge in self.edges() if edge[1] == x) for x in X))
-
-    def _neighbors_recursive(self, X, relation):
-        res = set()
-        new_members = X
-        while len(new_members) > 0:
-            res.update(new_members)
-            new_members = relation(new_members).difference(res)
-        return res
+        return self._nodes_of(j for i in self._indices(X) for j in self._pred[i])
 
     def descendants(self, X):
         """All descendants of all members of X, with X included."""
-        return self._neighbors_recursive(X, self.children)
+        return set(X).union(self._nodes_of(self._descendant_indices(self._indices(X))))
 
     def ancestors(self, X):
         """All ancestors of all members of X, with X included."""
-        return self._neighbors_recursive(X, self.parents)
+        return set(X).union(self._nodes_of(self._ancestor_indices(self._indices(X))))
 
     def neighbors(self, X):
         """All parents or children of all members of X."""
         return self.parents(X).union(self.children(X))
 
+    def has_cycles(self):
+        """True if the graph contains a directed cycle (Kahn's algorithm)."""
+        indices = self._node_index.values()
+        in_degree = {i: len(self._pred[i]) for i in indices}
+        stack = [i for i, degree in in_degree.items() if degree == 0]
+        n_sorted = 0
+        while len(stack) > 0:
+            i = stack.pop()
+            n_sorted += 1
+            for j in self._succ[i]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    stack.append(j)
+        return n_sorted < len(in_degree)
+
     def is_d_separated(self, X, Y, Z):
-        """True if X is d-separated from Y given Z."""
-        Z = set(Z)
-
-        if self.has_cycles():
-            raise RuntimeError("Requires an acyclic graph")
-
-        # X and Y are d-separated by Z if all paths are blocked.
-        # If we find a non-blocked path, we can stop and return False.
-        for x in X:
-            for y in Y:
-                for path in self.all_undirected_paths(x, y):
-                    path_blocked = False
-                    # Iterate over all nodes in the path
-                    for i in range(1, len(path) - 1):
-                        a, b, c = path[i - 1:i + 2]
-                        if self.is_collider(a, b, c):
-                            # If the middle node or its descendants do not contain
-                            # any node from Z, then the collider blocks the path
-                            if self.descendants({b}).isdisjoint(Z):
-                                path_blocked = True
-                                break
-                        # We have a chain or a fork, check if b is in Z
-                        elif b in Z:
-                            path_blocked = True
-                            break
-                    if not path_blocked:
-                        return False
-        return True
+        """True if X is d-separated from Y given Z, answered by a
+        `DSeparationIndex` of the graph built at the first query after each
+        modification.
+        """
+        if not set(X).isdisjoint(Y):
+            return False
+        return self._d_separation_index().is_d_separated(X, Y, Z)
+
+    def _d_separation_index(self):
+        if self._d_separation is None:
+            self._d_separation = DSeparationIndex(self)
+        return self._d_separation
+
+    def d_separation_batch(self, queries, processes=None):
+        """Answers many d-separation queries at once, sharing the
+        acyclicity check, the topological order and the ancestor sets.
+
+        :param queries: sequence of triples (X, Y, Z)
+        :param processes: number of worker processes, see
+            `DSeparationIndex.query_many`
+        :return: boolean numpy array, True where X is d-separated from Y
+            given Z
+        """
+        return self._d_separation_index().query_many(queries, processes)
 
     def remove_out_of(self, X):
-        """Returns a copy of the graph with all edges going out of X removed."""
+        """Returns a read-only view of the graph with all edges going out of
+        X removed.
+        """
         return self._graph_surgery(X, into_X=False)
 
     def remove_into(self, X):
-        """Returns a copy of the graph with all edges going into X removed."""
+        """Returns a read-only view of the graph with all edges going into X
+        removed.
+        """
         return self._graph_surgery(X, into_X=True)
 
     def _graph_surgery(self, X, into_X):
-        res = self.copy()
-        for x in X:
-            kwargs = {"to_node": x} if into_X else {"from_node": x}
-            for edge in self.edges(**kwargs):
-                res.del_edge(edge[0], edge[1])
-        return res
+        # Views are cached until the graph is modified
+        key = (frozenset(self._indices(X)), into_X)
+        if key not in self._views:
+            self._views[key] = MutilatedGraph(self, key[0], into_X)
+        return self._views[key]
+
+
+class _MaskedAdjacency:
+    """Index-based adjacency of a graph where the edges incident to some
+    nodes are hidden. If `clear_masked`, the masked nodes have no neighbors,
+    otherwise the masked nodes are removed from the neighbors of every node.
+    """
+    def __init__(self, adjacency, masked, clear_masked):
+        self.adjacency = adjacency
+        self.masked = masked
+        self.clear_masked = clear_masked
+
+    def __getitem__(self, i):
+        if self.clear_masked:
+            return set() if i in self.masked else self.adjacency[i]
+        neighbors = self.adjacency[i]
+        if neighbors.isdisjoint(self.masked):
+            return neighbors
+        return neighbors.difference(self.masked)
+
+
+class MutilatedGraph(CausalGraph):
+    """Read-only view of a `CausalGraph` where the edges going into (or out
+    of) a set of nodes are hidden. It shares the nodes and the adjacency of
+    the parent graph instead of copying them, and supports the same queries.
+    A view must not be used after its parent graph has been modified.
+
+    The other queries of `graph.Graph` (paths, searches, sorts...) read its
+    internal dictionaries, which are taken from a copy of the view built at
+    the first of these queries.
+    """
+    def __init__(self, parent, masked, into_X):
+        """Constructor.
+
+        :param parent: the `CausalGraph` (or view) to mutilate
+        :param masked: set of node indices of the parent graph
+        :param into_X: hide the edges going into the masked nodes if True,
+            the edges going out of them otherwise
+        """
+        self._parent = parent
+        self._masked = frozenset(masked)
+        self._into_X = into_X
+        self._node_index = parent._node_index
+        self._index_node = parent._index_node
+        self._succ = _MaskedAdjacency(parent._succ, self._masked, clear_masked=not into_X)
+        self._pred = _MaskedAdjacency(parent._pred, self._masked, clear_masked=into_X)
+        self._closure = None
+        self._version = 0
+        self._copy = None
+        self._cache = None
+        self._clear_caches()
+
+    @property
+    def version(self):
+        return self._parent.version
+
+    def _materialized(self):
+        if self._copy is None:
+            self._copy = self.copy()
+        return self._copy
+
+    @property
+    def _nodes(self):
+        return self._materialized()._nodes
+
+    @property
+    def _edges(self):
+        return self._materialized()._edges
+
+    @property
+    def _reverse_edges(self):
+        return self._materialized()._reverse_edges
+
+    @property
+    def _edge_count(self):
+        return self._materialized()._edge_count
+
+    @property
+    def _in_degree(self):
+        return self._materialized()._in_degree
+
+    @property
+    def _out_degree(self):
+        return self._materialized()._out_degree
+
+    def __str__(self):
+        return "{}({} nodes, {} edges)".format(
+            self.__class__.__name__, len(self._node_index), len(self.edges()))
+
+    def __contains__(self, item):
+        return item in self._node_index
+
+    def __eq__(self, other):
+        return self._materialized() == other
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("MutilatedGraph is a read-only view, use copy() to modify it")
+
+    add_edge = del_edge = add_node = del_node = from_dict = from_list = use_closure_index = _read_only
+
+    def copy(self):
+        return CausalGraph(from_dict=self.to_dict())
+
+    def node(self, node_id):
+        return self._parent.node(node_id)
+
+    def edge(self, node1, node2, default=None):
+        if node1 not in self._node_index or node2 not in self._node_index:
+            return default
+        if self._node_index[node2] not in self._succ[self._node_index[node1]]:
+            return default
+        return self._parent.edge(node1, node2, default)
+
+    def nodes(self, from_node=None, to_node=None, in_degree=None, out_degree=None):
+        if from_node is not None:
+            return [self._index_node[j] for j in self._succ[self._node_index[from_node]]] \
+                if from_node in self._node_index else []
+        if to_node is not None:
+            return [self._index_node[j] for j in self._pred[self._node_index[to_node]]] \
+                if to_node in self._node_index else []
+        if in_degree is not None:
+            return [n for n, i in self._node_index.items() if len(self._pred[i]) == in_degree]
+        if out_degree is not None:
+            return [n for n, i in self._node_index.items() if len(self._succ[i]) == out_degree]
+        return list(self._node_index)
+
+    def edges(self, path=None, from_node=None, to_node=None):
+        if path is not None:
+            return [(a, b, self.edge(a, b)) for a, b in zip(path[:-1], path[1:])]
+        if from_node is not None:
+            return [(from_node, n, self._parent.edge(from_node, n)) for n in self.nodes(from_node=from_node)]
+        if to_node is not None:
+            return [(n, to_node, self._parent.edge(n, to_node)) for n in self.nodes(to_node=to_node)]
+        return [edge for n in self._node_index for edge in self.edges(from_node=n)]
+
+    def in_degree(self, node):
+        return len(self._pred[self._node_index[node]])
+
+    def out_degree(self, node):
+        return len(self._succ[self._node_index[node]])
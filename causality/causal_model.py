@@ -1,8 +1,9 @@
-from functools import reduce
-from copy import copy, deepcopy
-from typing import Mapping
+from functools import reduce, partial
+from typing import Mapping, Sequence
 import numpy as np
+from causality.cache import BoundedCache
 from causality.causal_graph import CausalGraph
+from causality.contraction import ContractionPlan
 from causality.discrete_function import DiscreteFunction, ConstantFunction
 from causality.variable import Variable
 from causality.distribution import IndependentDistribution
@@ -15,28 +16,148 @@ def infer_causal_graph(functions):
             G.add_edge(X, Y)
     return G
 
+def _twin_network(graph, sources, var: Variable, value):
+    """Adds to `graph` the twin network under the intervention
+    `do(var = value)`, see `CausalModel.add_twin_network`, and returns a
+    dict mapping every added variable to a callable building its function.
+
+    :param sources: dict mapping every endogenous variable to the pair
+        (function, inputs) of its `DiscreteFunction`, updated with the
+        added variables
+    """
+    V_x = {v: v.do(var, value) for v in graph.descendants({var})}
+    res = {}
+    for v, v_x in V_x.items():
+        if v == var:
+            sources[v_x] = (lambda: value, ())
+            res[v_x] = partial(ConstantFunction, v_x, value)
+        else:
+            function, inputs = sources[v]
+            parents = tuple((V_x[pa] if pa in V_x else pa) for pa in inputs)
+            for pa in parents:
+                graph.add_edge(pa, v_x)
+            sources[v_x] = (function, parents)
+            res[v_x] = partial(DiscreteFunction, function, parents, v_x)
+    return res
+
+class _LazyFunctions(Mapping):
+    """Read-only mapping of the functions of a model with twin networks,
+    where the function of a twin variable (and its preimage) is only built
+    when it is first accessed.
+    """
+    def __init__(self, functions, recipes):
+        self._functions = {v: F for v, F in functions.items() if v not in recipes}
+        self._recipes = recipes
+
+    def __getitem__(self, var):
+        if var not in self._functions:
+            self._functions[var] = self._recipes[var]()
+        return self._functions[var]
+
+    def __contains__(self, var):
+        return var in self._functions or var in self._recipes
+
+    def __iter__(self):
+        yield from self._functions
+        yield from (v for v in self._recipes if v not in self._functions)
+
+    def __len__(self):
+        return len(self._functions) + sum(1 for v in self._recipes if v not in self._functions)
+
+def _sorted_endogenous(graph, functions, exo_dist):
+    # Check that we have a probability distribution on all nodes
+    # without a parent, or that they are constant functions
+    assert all(var in exo_dist.dists or isinstance(functions[var], ConstantFunction) \
+            for var in graph.nodes(in_degree=0))
+    return [v for v in graph.topological_sort() if v in functions]
+
+class CompiledModel:
+    def __init__(self, exo_dist, functions, graph, sorted_endogenous, cache_entries: int = 256):
+        """Read-only snapshot of the structure of a `CausalModel`, with
+        some twin networks added, as built by `CausalModel.compile`. The
+        functions (and their preimages) are shared with the model, not
+        copied, and those of the twin variables are only built when a query
+        needs them. The contraction plans of the queries are cached by their
+        dimensions in `plans`.
+        """
+        self.exo_dist = exo_dist
+        self.functions = functions
+        self.graph = graph
+        self.sorted_endogenous = tuple(sorted_endogenous)
+        self.plans = BoundedCache(cache_entries)
+
+    def _plan(self, dimensions, heuristic):
+        """Returns the `ContractionPlan` eliminating the endogenous
+        variables of a set over `dimensions`, and the functions whose
+        preimages it contracts after that set.
+        """
+        key = (tuple(dimensions), heuristic)
+        res = self.plans.get(key)
+        if res is None:
+            # Only the endogenous ancestors of the variables of the set are
+            # relevant: the other functions are barren, their preimages
+            # contain every value of their inputs. This also leaves out the
+            # exogenous variables which are not ancestors.
+            ancestors = self.graph.ancestors(set(dimensions))
+            relevant = [var for var in self.sorted_endogenous if var in ancestors]
+            functions = [self.functions[var] for var in relevant]
+            plan = ContractionPlan(
+                [dimensions] + [F.total_variables for F in functions],
+                [F.output for F in functions],
+                heuristic)
+            res = (plan, functions)
+            self.plans[key] = res
+        return res
+
 class CausalModel:
     def __init__(
             self,
             exo_dist: IndependentDistribution,
-            functions: Mapping[Variable, DiscreteFunction]):
+            functions: Mapping[Variable, DiscreteFunction],
+            cache_entries: int = 64):
+        """Constructor.
+
+        :param exo_dist: distribution of the exogenous variables
+        :param functions: the function of every endogenous variable
+        :param cache_entries: maximal number of compiled models (one per
+            sequence of twin networks) kept for `probability`, see
+            `compiled_models`
+        """
         self.exo_dist = exo_dist
         self.functions = functions
         self.graph = infer_causal_graph(functions)
         self.twin_networks = set()
+        self.compiled_models = BoundedCache(cache_entries)
         self._update_sorted_endogenous()
     
     def _update_sorted_endogenous(self):
-        # Check that we have a probability distribution on all nodes
-        # without a parent, or that they are constant functions
-        assert all(var in self.exo_dist.dists or isinstance(self.functions[var], ConstantFunction) \
-                for var in self.graph.nodes(in_degree=0))
-        self.sorted_endogenous = [v for v in self.graph.topological_sort() \
-                if v in self.functions.keys()]
+        self.sorted_endogenous = _sorted_endogenous(self.graph, self.functions, self.exo_dist)
+        # The structure changed, previously compiled models are stale
+        self.compiled_models.clear()
+
+    def compile(self, interventions: Sequence[tuple] = ()) -> CompiledModel:
+        """Returns the model with the twin networks of the interventions
+        `(var, value)` added in this order, as a `CompiledModel`. It is
+        built once and cached until the model is modified by
+        `intervention` or `add_twin_network`.
+        """
+        interventions = tuple(interventions)
+        res = self.compiled_models.get(interventions)
+        if res is None:
+            graph = self.graph.copy()
+            sources = {v: (F.function, F.inputs) for v, F in self.functions.items()}
+            recipes = {}
+            for intervention in interventions:
+                recipes.update(_twin_network(graph, sources, *intervention))
+            functions = _LazyFunctions(self.functions, recipes)
+            sorted_endogenous = _sorted_endogenous(graph, functions, self.exo_dist)
+            res = CompiledModel(self.exo_dist, functions, graph, sorted_endogenous)
+            self.compiled_models[interventions] = res
+        return res
     
     def rvs(self, size: int) -> dict[Variable, np.ndarray]:
         # Step 1: all exogenous variables are sampled
-        values = self.exo_dist.sample(size)
+        values = self.exo_dist.rvs(size)
         
         # Step 2: all endogenous variables are iterated in topological order
         for var in self.sorted_endogenous:
@@ -48,34 +169,44 @@ class CausalModel:
             values[var] = function.function(*[values[parent] for parent in function.inputs])
         return values
     
-    def probability(self, expression: Expression) -> float:
-        values = expression.values()
-        
-        # If we have counterfactual variables, add the twin networks
-        # to this model
-        model = deepcopy(self)
+    def _compile_for(self, values) -> CompiledModel:
+        # If we have counterfactual variables, use this model with
+        # the twin networks added
+        interventions = []
         for var in values.dimensions:
-            if var.intervention is not None and var.intervention not in model.twin_networks:
-                model.add_twin_network(*var.intervention)
-                
-        # While there are endogenous variables in values
-        while True:
-            # Sort them in reversed topological order
-            endogenous = [v for v in model.sorted_endogenous[::-1] \
-                    if v in values.dimensions]
-            
-            if len(endogenous) == 0:
-                break
-                
-            for var in endogenous:
-                # The set of values that satisfy the functional
-                # definition of var and the current set of values is
-                # found with the tensor product where the sum is over
-                # var. Trust me.
-                values = values.tensor(model.functions[var].preimage, var)
-                
-        # Now we have the set of values of exogenous variables
-        # that satisfy the expression, we only need to measure their probability
+            if var.intervention is not None and var.intervention not in self.twin_networks \
+                    and var.intervention not in interventions:
+                interventions.append(var.intervention)
+        return self.compile(interventions)
+
+    def plan(self, expression: Expression, heuristic: str = "min_fill") -> ContractionPlan:
+        """Returns the `ContractionPlan` of `probability(expression)`
+        without executing it, e.g. to check its `peak_size`.
+        """
+        values = expression.values()
+        return self._compile_for(values)._plan(values.dimensions, heuristic)[0]
+
+    def probability(self, expression: Expression, heuristic: str = "min_fill", max_size: int = None) -> float:
+        """Probability that `expression` holds.
+
+        The set of values satisfying the expression and the preimages of
+        the functions of its endogenous variables (and of their endogenous
+        ancestors) form a network of boolean sets. Its endogenous variables
+        are summed out in the order of a `ContractionPlan`, which gives the
+        set of values of the exogenous variables that satisfy the
+        expression, and we only need to measure its probability.
+
+        :param heuristic: heuristic choosing the order of the variables,
+            see `ContractionPlan`
+        :param max_size: if the largest set of the plan has more cells, a
+            ValueError is raised before anything is computed
+        """
+        values = expression.values()
+        model = self._compile_for(values)
+        plan, functions = model._plan(values.dimensions, heuristic)
+        if max_size is not None and plan.peak_size > max_size:
+            raise ValueError("The contraction needs a set of {} cells, more than {}".format(plan.peak_size, max_size))
+        values = plan.execute([values] + [F.preimage for F in functions])
         return model.exo_dist.pmf(values)
     
     def intervention(self, var: Variable, value):
@@ -88,6 +219,7 @@ class CausalModel:
         self.functions[var] = ConstantFunction(var, value)
         for pa in self.graph.parents({var}):
             self.graph.del_edge(pa, var)
+        self.compiled_models.clear()
     
     def add_twin_network(self, var: Variable, value):
         """Add a twin network under the intervention `do(var = value)`.
@@ -96,15 +228,8 @@ class CausalModel:
         function of the duplicated instance of `var` is replaced by
         a constant function, like if we did `self.intervention(var, value)`.
         """
-        V_x = {v: v.do(var, value) for v in self.graph.descendants({var})}
-        for v, v_x in V_x.items():
-            if v == var:
-                self.functions[v_x] = ConstantFunction(v_x, value)
-            else:
-                F = self.functions[v]
-                parents = tuple((V_x[pa] if pa in V_x else pa) for pa in F.inputs)
-                for pa in parents:
-                    self.graph.add_edge(pa, v_x)
-                self.functions[v_x] = DiscreteFunction(F.function, parents, v_x)
+        sources = {v: (F.function, F.inputs) for v, F in self.functions.items()}
+        for v_x, recipe in _twin_network(self.graph, sources, var, value).items():
+            self.functions[v_x] = recipe()
         self._update_sorted_endogenous()
     
@@ -0,0 +1,117 @@
+from itertools import combinations
+from math import prod
+from string import ascii_letters
+from typing import Iterable, Sequence
+import numpy as np
+from causality.variable import Variable
+from causality.discrete_set import DiscreteSet
+
+
+def _size(dimensions) -> int:
+    """Number of cells of a set over `dimensions`."""
+    return prod(len(var.support) for var in dimensions)
+
+
+def _union(dimensions: Iterable[Sequence[Variable]]) -> tuple:
+    """Distinct variables of a sequence of dimension tuples, in order."""
+    return tuple(dict.fromkeys(var for dims in dimensions for var in dims))
+
+
+class ContractionPlan:
+    def __init__(
+            self,
+            dimensions: Sequence[Sequence[Variable]],
+            eliminated: Iterable[Variable],
+            heuristic: str = "min_fill"):
+        """Order in which to sum out the variables `eliminated` of a
+        network of boolean sets (the preimages of functions and the set of
+        an expression), whose product is the set of valuations of the
+        other variables satisfying all of them.
+
+        Each step sums out one variable, by contracting the sets where it
+        appears into one set over their other dimensions (bucket
+        elimination). The variable is chosen greedily on the graph linking
+        the variables sharing a set, and the einsum path of every step is
+        computed once, so that the plan can be executed on many networks
+        with the same dimensions. A step can involve at most 52 variables,
+        the number of subscripts of einsum, so a ValueError is raised for
+        networks needing larger sets.
+
+        :param dimensions: the dimensions of every set of the network
+        :param eliminated: the variables to sum out
+        :param heuristic: "min_fill" to sum out first the variable adding
+            the fewest links between the other variables, or "greedy" to
+            sum out first the variable giving the smallest set
+        """
+        if heuristic not in ("min_fill", "greedy"):
+            raise ValueError("Unknown heuristic " + str(heuristic))
+        self.heuristic = heuristic
+        self.input_dimensions = [tuple(dims) for dims in dimensions]
+        # The size of the largest set, input or intermediate, in cells
+        self.peak_size = max((_size(dims) for dims in self.input_dimensions), default=1)
+        # Steps are (positions of the consumed sets, position of the
+        # resulting set, einsum subscripts, einsum path)
+        self.steps = []
+        self.order = []
+
+        sets = dict(enumerate(self.input_dimensions))
+        remaining = list(dict.fromkeys(eliminated))
+        rank = {var: k for k, var in enumerate(remaining)}
+        adjacency = {var: set() for dims in self.input_dimensions for var in dims}
+        for dims in self.input_dimensions:
+            for var in dims:
+                adjacency[var].update(v for v in dims if v != var)
+
+        while len(remaining) > 0:
+            var = min(remaining, key=lambda v: self._cost(adjacency, v, rank[v]))
+            remaining.remove(var)
+            self.order.append(var)
+            positions = [k for k, dims in sets.items() if var in dims]
+            result = tuple(v for v in _union(sets[k] for k in positions) if v != var)
+            self._add_step(sets, positions, result)
+            # The neighbors of var are now linked by the resulting set
+            for v in adjacency.pop(var):
+                adjacency[v].discard(var)
+                adjacency[v].update(w for w in result if w != v)
+
+        # Product of the remaining sets, over the variables that are kept
+        self.dimensions = _union(sets.values())
+        self._add_step(sets, list(sets), self.dimensions)
+
+    def _cost(self, adjacency, var, index):
+        neighbors = adjacency[var]
+        fill = sum(1 for a, b in combinations(neighbors, 2) if b not in adjacency[a])
+        size = _size(neighbors)
+        return (fill, size, index) if self.heuristic == "min_fill" else (size, fill, index)
+
+    def _add_step(self, sets, positions, result):
+        variables = _union([result] + [sets[k] for k in positions])
+        if len(variables) > len(ascii_letters):
+            raise ValueError("A contraction over {} variables exceeds the {} subscripts supported by einsum".format(
+                len(variables), len(ascii_letters)))
+        letters = {var: ascii_letters[i] for i, var in enumerate(variables)}
+        subscripts = ",".join("".join(letters[v] for v in sets[k]) for k in positions) \
+            + "->" + "".join(letters[v] for v in result)
+        # The path only depends on the shapes, computed on empty views
+        operands = [np.broadcast_to(np.zeros((), dtype=bool), [len(v.support) for v in sets[k]]) for k in positions]
+        path = np.einsum_path(subscripts, *operands, optimize="greedy")[0] if len(positions) > 1 else False
+        position = len(self.input_dimensions) + len(self.steps)
+        self.steps.append((positions, position, subscripts, path))
+        self.peak_size = max(self.peak_size, _size(result))
+        for k in positions:
+            del sets[k]
+        sets[position] = result
+
+    def __str__(self):
+        return "{}({} steps, order {}, peak size {})".format(
+            self.__class__.__name__, len(self.steps), self.order, self.peak_size)
+
+    def execute(self, sets: Sequence[DiscreteSet]) -> DiscreteSet:
+        """Contracts sets with the dimensions given to the constructor, in
+        the same order, and returns the set over the kept variables.
+        """
+        arrays = {k: set_.values for k, set_ in enumerate(sets)}
+        for positions, position, subscripts, path in self.steps:
+            operands = [arrays.pop(k) for k in positions]
+            arrays[position] = np.einsum(subscripts, *operands, optimize=path)
+        return DiscreteSet(self.dimensions, arrays[position])
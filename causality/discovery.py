@@ -1,85 +1,828 @@
-from itertools import combinations
+from collections import deque
+from heapq import merge
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import combinations, repeat, islice, chain
+import numpy as np
 from causality.causal_graph import CausalGraph
+from causality.pvalue_store import CachedIndependenceTest
 
-def pc_algorithm(data, indep_test, alpha, initial_graph=None, **kwargs):
+def _find_separating_set(indep_test, x, y, adj_x_y, cond_set_size, alpha, kwargs):
+    """Returns the first subset Z of adj_x_y of size cond_set_size such that x
+    and y are independent given Z, or None.
+    """
+    # combinations will return an empty list if cond_set_size > len(adj_x_y)
+    for Z in combinations(adj_x_y, cond_set_size):
+        p = indep_test.indep_test(x, y, Z, **kwargs)
+        if p > alpha:
+            return Z
+    return None
+
+def _remove_edge(graph, sep_set, x, y, Z):
+    graph.del_edge(x, y)
+    graph.del_edge(y, x)
+    sep_set[(x, y)] = Z
+    sep_set[(y, x)] = Z
+
+def _indep_test_many(indep_test, tests, kwargs):
+    return indep_test.indep_test_many(tests, **kwargs)
+
+def _batched_separating_sets(indep_test, pairs, candidates, alpha, cond_set_size, executor, n_jobs, kwargs):
+    """Like `_find_separating_set` on every pair, using
+    `indep_test.indep_test_many`. Each round tests the next conditioning sets
+    of all the pairs without a separating set in one batch, with twice as
+    many sets per pair as in the previous round.
+    """
+    iterators = [combinations(adj_x_y, cond_set_size) for adj_x_y in candidates]
+    found = [None] * len(pairs)
+    active = list(range(len(pairs)))
+    sets_per_pair = 1
+    while len(active) > 0:
+        tests = []
+        owners = []
+        exhausted = set()
+        for k in active:
+            x, y = pairs[k]
+            Zs = list(islice(iterators[k], sets_per_pair))
+            if len(Zs) < sets_per_pair:
+                exhausted.add(k)
+            tests += [(x, y, Z) for Z in Zs]
+            owners += [k] * len(Zs)
+
+        if executor is None or len(tests) < n_jobs:
+            p_values = _indep_test_many(indep_test, tests, kwargs)
+        else:
+            chunk_size = -(-len(tests) // n_jobs)
+            chunks = [tests[i:i + chunk_size] for i in range(0, len(tests), chunk_size)]
+            p_values = [p for chunk in executor.map(_indep_test_many, repeat(indep_test), chunks, repeat(kwargs)) \
+                for p in chunk]
+
+        for k, (_, _, Z), p in zip(owners, tests, p_values):
+            if p > alpha and found[k] is None:
+                found[k] = Z
+        active = [k for k in active if found[k] is None and k not in exhausted]
+        sets_per_pair *= 2
+    return found
+
+def _stable_level(graph, nodes, indep_test, alpha, cond_set_size, executor, n_jobs, kwargs):
+    """Runs all the tests of one conditioning set size on the adjacencies
+    frozen at the start of the level, and returns the separating sets found
+    for every ordered pair (x, y) in a deterministic order.
+    """
+    adjacency = {x: set(graph.nodes(from_node=x)) for x in nodes}
+    pairs = [(x, y) for x in nodes for y in nodes if y in adjacency[x]]
+    # Conditioning sets are drawn in the order of nodes, not of the sets
+    candidates = [[z for z in nodes if z in adjacency[x] and z != y] for x, y in pairs]
+    if hasattr(indep_test, "indep_test_many"):
+        results = _batched_separating_sets(
+            indep_test, pairs, candidates, alpha, cond_set_size, executor, n_jobs, kwargs)
+    else:
+        args = (
+            repeat(indep_test),
+            (x for x, y in pairs),
+            (y for x, y in pairs),
+            candidates,
+            repeat(cond_set_size),
+            repeat(alpha),
+            repeat(kwargs)
+        )
+        if executor is None:
+            results = map(_find_separating_set, *args)
+        else:
+            chunk_size = max(1, len(pairs) // (4 * n_jobs))
+            results = executor.map(_find_separating_set, *args, chunksize=chunk_size)
+    return [(x, y, Z) for (x, y), Z in zip(pairs, results) if Z is not None]
+
+def _skeleton(graph, indep_test, alpha, stable, n_jobs, backend, kwargs):
+    """Removes the edges of `graph` using conditional independence tests,
+    and returns the separating sets of the removed edges.
+    """
+    if n_jobs > 1 and not stable:
+        raise ValueError("Parallel tests require stable=True")
+
+    nodes = graph.nodes()
+    cond_set_size = 0
+    sep_set = {}
+
+    executor = None
+    if n_jobs > 1:
+        executor_class = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}[backend]
+        executor = executor_class(n_jobs)
+
+    try:
+        while max(graph.out_degree(x) for x in nodes) > cond_set_size:
+            if hasattr(indep_test, "prefetch"):
+                # The tests of x only involve x and its adjacencies
+                indep_test.prefetch([[x] + list(graph.nodes(from_node=x)) for x in nodes])
+            if stable:
+                removals = _stable_level(graph, nodes, indep_test, alpha, cond_set_size, executor, n_jobs, kwargs)
+                for x, y, Z in removals:
+                    # The first separating set found in the order of nodes is kept
+                    if graph.is_adjacent(x, y):
+                        _remove_edge(graph, sep_set, x, y, Z)
+            else:
+                for x in nodes:
+                    adj_x = set(graph.nodes(from_node=x))
+                    for y in adj_x:
+                        Z = _find_separating_set(indep_test, x, y, adj_x.difference({y}), cond_set_size, alpha, kwargs)
+                        if Z is not None:
+                            _remove_edge(graph, sep_set, x, y, Z)
+            if hasattr(indep_test, "flush"):
+                indep_test.flush()
+            cond_set_size += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return sep_set
+
+
+def pc_algorithm(data, indep_test, alpha, initial_graph=None, stable=False, n_jobs=1, backend="thread", **kwargs):
+    """PC algorithm, returning the estimated CPDAG as a CausalGraph where
+    undirected edges are represented in both directions.
+
+    :param data: data matrix, only used for its number of columns when
+        `initial_graph` is None
+    :param indep_test: object with a method `indep_test(x, y, Z)` returning
+        the p-value of the independence of x and y given Z
+    :param alpha: significance level of the independence tests
+    :param initial_graph: graph to start from, the complete graph over
+        V0, V1, ... by default
+    :param stable: if True, use the order-independent "stable" PC of
+        Colombo and Maathuis (2014), where the adjacencies are frozen at the
+        start of each conditioning set size. If `indep_test` has a method
+        `indep_test_many(tests)` (see `GaussianIndependenceTest`), the tests
+        of a level are then evaluated in batches.
+    :param n_jobs: number of workers running the tests of one level in
+        parallel, requires `stable`
+    :param backend: "thread" or "process", the kind of pool of workers
+    If `indep_test` has a method `prefetch(column_groups)`, it is called at
+    the start of each conditioning set size with the adjacencies of every
+    node.
+    Other keyword arguments are passed to `indep_test.indep_test`.
+    """
     if initial_graph is None:
         graph = CausalGraph()
         for i in range(data.shape[1]):
-            grap.add_node("V" + str(i))
+            graph.add_node("V" + str(i))
         graph = graph.complete()
     else:
         graph = initial_graph
 
-    nodes = graph.nodes()
-    cond_set_size = 0
-    sep_set = {}
+    sep_set = _skeleton(graph, indep_test, alpha, stable, n_jobs, backend, kwargs)
+    orient_edges(graph, sep_set)
+    return graph
+
+
+def pc_algorithm_sweep(data, indep_test, alphas, initial_graph=None, **kwargs):
+    """Runs `pc_algorithm` for every significance level in `alphas`, and
+    returns a dict `{alpha: graph}`.
+
+    The p-values do not depend on alpha, so unless `indep_test` is already
+    a `CachedIndependenceTest` (e.g. on an on-disk `PValueStore` shared
+    with previous sweeps), it is wrapped in one, and each test is only
+    computed by the first run needing it. The runs are done from the
+    largest alpha, which removes the fewest edges and thus runs most of the
+    tests. Other arguments are as in `pc_algorithm`.
+    """
+    if not isinstance(indep_test, CachedIndependenceTest):
+        indep_test = CachedIndependenceTest(indep_test)
+    graphs = {}
+    for alpha in sorted(alphas, reverse=True):
+        graph = None if initial_graph is None else initial_graph.copy()
+        graphs[alpha] = pc_algorithm(data, indep_test, alpha, initial_graph=graph, **kwargs)
+    return {alpha: graphs[alpha] for alpha in alphas}
+
+
+class IncrementalPC:
+    def __init__(self, indep_test, alpha, nodes, n_jobs=1, backend="thread", **kwargs):
+        """Stable PC algorithm on data arriving in batches.
+
+        The search only depends on the decisions p > alpha of its tests, so
+        after a batch is merged (see `update`) only the tests whose
+        decision may have changed are recomputed. If `indep_test` has a
+        method `p_value_bounds()` (see `GaussianIndependenceTest`), these
+        are the tests whose p-values can now be on the other side of alpha,
+        given how much the statistics moved; otherwise all of them are.
 
-    # Remove edges using conditional independence tests
-    while max(graph.out_degree(x) for x in nodes) > cond_set_size:
+        When decisions changed, the levels of the search are replayed: a
+        pair keeps its result at a level unless the decision of one of the
+        tests which gave it changed, or the adjacencies of its first node at
+        the start of the level gained a node or lost one of its separating
+        set. Only the other pairs are tested again, mostly from kept
+        p-values. Then only the connected components where an adjacency or
+        a separating set changed are oriented again, see `_reorient`.
+
+        :param indep_test: test with the methods `update(source)` and
+            `indep_test_many(tests)`, such as `GaussianIndependenceTest`
+        :param nodes: the variables, in the order used by the search
+        Other arguments are as in `pc_algorithm`, except that the process
+        backend is not supported. The search is run by the constructor, see
+        `graph` and `sep_set`.
+        """
+        if n_jobs > 1 and backend != "thread":
+            raise ValueError("IncrementalPC only supports the thread backend")
+        self.indep_test_object = indep_test
+        self.alpha = alpha
+        self.nodes = list(nodes)
+        self.n_jobs = n_jobs
+        self.backend = backend
+        self.kwargs = kwargs
+        self._bounds = indep_test.p_value_bounds() if hasattr(indep_test, "p_value_bounds") else None
+        # p-values of the tests deciding the results of the current search
+        # (and of the ones computed during a search), keyed by _key, as of
+        # the last time they were computed
+        self.tests = {}
+        # Keys of the tests computed since the last call to _search
+        self._computed = []
+        # For every level of the current search: the adjacencies at its
+        # start, and {(x, y): (separating set or None, keys of the tests
+        # deciding it)} for the pairs tested at this level
+        self._levels = []
+        self.graph = None
+        self.sep_set = None
+        # Number of p-values computed by the initial search or the last
+        # update
+        self.computed = 0
+        self._search(set())
+
+    def _skeleton(self, flipped):
+        """Stable PC skeleton reusing the results of the previous search
+        that do not depend on the tests with keys in `flipped`.
+        """
+        nodes = self.nodes
+        # Adjacencies of the complete graph, the graph is only built at the
+        # end
+        adjacency = {x: {y for y in nodes if y != x} for x in nodes}
+        sep_set = {}
+        levels = []
+
+        dirty = set()
+        for level, (_, results) in enumerate(self._levels):
+            for pair, (_, keys) in results.items():
+                if not flipped.isdisjoint(keys):
+                    dirty.add((level, pair))
+
+        executor = None
+        if self.n_jobs > 1:
+            executor = ThreadPoolExecutor(self.n_jobs)
+        try:
+            level = 0
+            while max(len(adjacency[x]) for x in nodes) > level:
+                frozen = {x: frozenset(adjacency[x]) for x in nodes}
+                old_frozen, old_results = self._levels[level] if level < len(self._levels) else ({}, {})
+                results = {}
+                pairs = []
+                for x in nodes:
+                    # If the adjacencies of x only lost nodes, the sets
+                    # tested for (x, y) are a subsequence of the old ones,
+                    # and the old result stays unless it used a lost node
+                    shrunk = x in old_frozen and frozen[x] <= old_frozen[x]
+                    for y in nodes:
+                        if y not in frozen[x]:
+                            continue
+                        if shrunk and (level, (x, y)) not in dirty:
+                            Z, keys = old_results[(x, y)]
+                            if Z is None or frozen[x].issuperset(Z):
+                                results[(x, y)] = (Z, keys)
+                                continue
+                        pairs.append((x, y))
+
+                if len(pairs) > 0:
+                    self.prefetch([[x] + list(frozen[x]) for x in {x for x, _ in pairs}])
+                    candidates = [[z for z in nodes if z in frozen[x] and z != y] for x, y in pairs]
+                    found = _batched_separating_sets(
+                        self, pairs, candidates, self.alpha, level, executor, self.n_jobs, self.kwargs)
+                    for (x, y), adj_x_y, Z in zip(pairs, candidates, found):
+                        # The result only depends on the tests up to the
+                        # first independence
+                        keys = []
+                        for S in combinations(adj_x_y, level):
+                            keys.append(self._key(x, y, S))
+                            if S == Z:
+                                break
+                        results[(x, y)] = (Z, frozenset(keys))
+                    self.flush()
+
+                for x in nodes:
+                    for y in nodes:
+                        # The first separating set found in the order of
+                        # nodes is kept
+                        if (x, y) in results and results[(x, y)][0] is not None and y in adjacency[x]:
+                            adjacency[x].discard(y)
+                            adjacency[y].discard(x)
+                            sep_set[(x, y)] = sep_set[(y, x)] = results[(x, y)][0]
+                levels.append((frozen, results))
+                level += 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # Edges added in the same order as by CausalGraph.complete
+        graph = CausalGraph()
+        for node in nodes:
+            graph.add_node(node)
         for x in nodes:
-            adj_x = set(graph.nodes(from_node=x))
-            for y in adj_x:
-                adj_x_y = adj_x.difference({y})
-                # combinations will return an empty list if cond_set_size > len(adj_x_y)
-                for Z in combinations(adj_x_y, cond_set_size):
-                    p = indep_test.indep_test(x, y, Z, **kwargs)
-                    if p > alpha:
-                        graph.del_edge(x, y)
-                        graph.del_edge(y, x)
-                        sep_set[(x, y)] = Z
-                        sep_set[(y, x)] = Z
-                        break
-        cond_set_size += 1
-
-    for (x, y) in combinations(nodes, 2):
-        # Orient colliders
-        if not graph.is_adjacent(x, y) and (x, y) in sep_set:
-            rel_x = graph.undirected_neighbors({x})
-            rel_y = graph.undirected_neighbors({y})
-            for z in rel_x.intersection(rel_y):
-                if z not in sep_set[(x, y)]:
-                    # Orient as x -> z <- y
-                    graph.del_edge(z, x)
-                    graph.del_edge(z, y)
-
-        # Orient undirected edges
-        # Rules for remaining orientations, see e.g. Pearl 2000 sec. 2.5
-        # R1: orient x - y as x -> y if there is z -> x with y not adjacent
-        # to z
-        if graph.is_undirected(x, y):
-            parents_x = {z for z in graph.parents({x}) if not graph.is_undirected(x, z)}
-            for z in parents_x:
-                if not graph.is_adjacent(z, y):
-                    graph.del_edge(y, x)
-                    break
-
-        # R2: orient x - y as x -> y if there is a chain x -> z -> y for
-        # some z
-        if graph.is_undirected(x, y):
-            children_x = {z for z in graph.children({x}) if not graph.is_undirected(x, z)}
-            parents_y = {z for z in graph.parents({y}) if not graph.is_undirected(y, z)}
-            if not children_x.isdisjoint(parents_y):
-                graph.del_edge(y, x)
-
-        # R3: orient x - y as x -> y if there are two chains x - w -> y and
-        # x - z -> y with w and z not adjacent
-        if graph.is_undirected(x, y):
-            for (z, w) in combinations(parents_y, 2):
-                if graph.is_undirected(x, z) and graph.is_undirected(x, w):
-                    graph.del_edge(y, x)
-                    break
-
-        # R4: orient x - y as x -> y if there are two chains x - w -> z and
-        # w -> z -> y such that w and y are not adjacent and x and z are
-        # adjacent
-        if graph.is_undirected(x, y):
-            for z in parents_y:
-                if graph.is_adjacent(x, z):
-                    for w in graph.undirected_neighbors(x):
-                        if not graph.is_adjacent(w, y) and graph.is_directed(w, z):
-                            graph.del_edge(y, x)
-                            break
-                    if graph.is_directed(x, y):
-                        break
+            for y in nodes:
+                if y in adjacency[x]:
+                    graph.add_edge(x, y)
+        return graph, sep_set, levels
+
+    @staticmethod
+    def _key(x, y, Z):
+        # Conditioning sets are always drawn in the order of nodes, so the
+        # test of y and x given Z has the same key
+        return (x, y, tuple(Z)) if x < y else (y, x, tuple(Z))
+
+    def _search(self, flipped):
+        graph, sep_set, self._levels = self._skeleton(flipped)
+        kept = set()
+        for _, results in self._levels:
+            for _, keys in results.values():
+                kept.update(keys)
+        if self._bounds is not None:
+            self._bounds.discard([key for key in self._bounds.rows if key not in kept])
+            computed = [key for key in dict.fromkeys(self._computed) if key in kept]
+            self._bounds.track(computed, [self.tests[key][0] for key in computed])
+        for key in self.tests.keys() - kept:
+            del self.tests[key]
+        self._computed = []
+
+        if self.graph is None:
+            orient_edges(graph, sep_set)
+        else:
+            _reorient(self.graph, self.sep_set, graph, sep_set)
+        self.graph = graph
+        self.sep_set = sep_set
+
+    def prefetch(self, column_groups):
+        if hasattr(self.indep_test_object, "prefetch"):
+            self.indep_test_object.prefetch(column_groups)
+
+    def flush(self):
+        if hasattr(self.indep_test_object, "flush"):
+            self.indep_test_object.flush()
+
+    def indep_test(self, x, y, Z, **kwargs):
+        return self.indep_test_many([(x, y, Z)], **kwargs)[0]
+
+    def indep_test_many(self, tests, **kwargs):
+        """p-values used by the search, computed once."""
+        keys = [self._key(x, y, Z) for x, y, Z in tests]
+        missing = [t for t, key in enumerate(keys) if key not in self.tests]
+        if len(missing) > 0:
+            p_values = self.indep_test_object.indep_test_many([tests[t] for t in missing], **kwargs)
+            for t, p in zip(missing, p_values):
+                self.tests[keys[t]] = (tests[t], p)
+                self._computed.append(keys[t])
+            self.computed += len(missing)
+        return np.array([self.tests[key][1] for key in keys])
+
+    def margins(self):
+        """Smallest distance |p - alpha| of the tests of every pair of nodes
+        `frozenset((x, y))`, with the p-values of the last time they were
+        computed. Small margins are the decisions most likely to change with
+        more data.
+        """
+        res = {}
+        for (x, y, Z), p in self.tests.values():
+            edge = frozenset((x, y))
+            res[edge] = min(res.get(edge, 1), abs(p - self.alpha))
+        return res
+
+    def update(self, source, chunk_size: int = 100000) -> bool:
+        """Merges a batch of data (see `iter_chunks`) into the test, and
+        updates `graph` and `sep_set`.
+
+        :return: True if a decision changed and the search was replayed
+        """
+        self.indep_test_object.update(source, chunk_size)
+        self.computed = 0
+        if self._bounds is None:
+            keys = list(self.tests)
+        else:
+            keys, low, high = self._bounds.bounds()
+        independent = np.array([self.tests[key][1] > self.alpha for key in keys], dtype=bool)
+        if self._bounds is None:
+            uncertain = np.ones(len(keys), dtype=bool)
+        else:
+            # Only the tests whose p-value can now be on the other side of
+            # alpha are recomputed
+            uncertain = np.where(independent, low <= self.alpha, high > self.alpha)
+        recomputed = np.flatnonzero(uncertain)
+        if len(recomputed) == 0:
+            return False
+
+        keys = [keys[t] for t in recomputed]
+        tests = [self.tests[key][0] for key in keys]
+        p_values = self.indep_test_object.indep_test_many(tests, **self.kwargs)
+        self.computed = len(keys)
+        flipped = set()
+        for key, test, p, was_independent in zip(keys, tests, p_values, independent[recomputed]):
+            self.tests[key] = (test, p)
+            if (p > self.alpha) != was_independent:
+                flipped.add(key)
+        if self._bounds is not None:
+            self._bounds.track(keys, tests)
+        if len(flipped) == 0:
+            return False
+        self._search(flipped)
+        return True
+
+
+def _reorient(old_graph, old_sep_set, graph, sep_set):
+    """Orients the skeleton `graph` with separating sets `sep_set` like
+    `orient_edges`, given the graph `old_graph` oriented from
+    `old_sep_set`.
+
+    The rules only look at the edges of one connected component, so only
+    the components holding a pair whose adjacency or separating set
+    changed are oriented again, and the others keep their old orientation.
+    Separating sets contradicting each other can make the rules orient an
+    edge either way depending on the order of the worklist: a whole
+    component is examined in the same order as by `orient_edges`, which
+    keeps the result the same.
+    """
+    old_adjacencies = {frozenset((x, y)) for x, y, _ in old_graph.edges()}
+    adjacencies = {frozenset((x, y)) for x, y, _ in graph.edges()}
+    changed = old_adjacencies.symmetric_difference(adjacencies)
+    changed.update(frozenset(pair) for pair, Z in sep_set.items() if old_sep_set.get(pair) != Z)
+
+    region = set()
+    stack = [x for pair in changed for x in pair]
+    while len(stack) > 0:
+        u = stack.pop()
+        if u not in region:
+            region.add(u)
+            stack += graph.neighbors({u})
+
+    for x, y, _ in old_graph.edges():
+        if x not in region and old_graph.edge(y, x) is None:
+            graph.del_edge(y, x)
+    orient_colliders(graph, sep_set, region)
+    apply_meek_rules(graph, [(x, y) for x, y, _ in graph.edges() if x in region and graph.is_undirected(x, y)])
+
+
+def orient_colliders(graph, sep_set, centers=None):
+    """Orients every unshielded triple x - z - y of the skeleton as
+    x -> z <- y when z is not in the separating set of x and y. The
+    colliders are found before orienting any edge, and an edge already
+    oriented by a previous collider is kept.
+
+    :param centers: the nodes z to examine, all the nodes by default
+    """
+    order = {node: k for k, node in enumerate(graph.nodes())}
+    colliders = []
+    for z in graph.nodes():
+        if centers is not None and z not in centers:
+            continue
+        neighbors_z = sorted(graph.undirected_neighbors({z}), key=order.get)
+        for x, y in combinations(neighbors_z, 2):
+            if not graph.is_adjacent(x, y) and (x, y) in sep_set and z not in sep_set[(x, y)]:
+                colliders.append((x, z, y))
+    for x, z, y in colliders:
+        for w in (x, y):
+            if graph.is_undirected(w, z):
+                graph.del_edge(z, w)
+
+
+def _directed_parents(graph, x):
+    return {z for z in graph.parents({x}) if graph.edge(x, z) is None}
+
+
+def _meek_rule_applies(graph, x, y):
+    """True if one of the rules R1 to R4 orients x - y as x -> y, see e.g.
+    Pearl 2000 sec. 2.5.
+    """
+    # R1: there is z -> x with y not adjacent to z
+    if any(not graph.is_adjacent(z, y) for z in _directed_parents(graph, x)):
+        return True
+
+    # R2: there is a chain x -> z -> y
+    parents_y = _directed_parents(graph, y)
+    if any(graph.is_directed(x, z) for z in parents_y):
+        return True
+
+    # R3: there are two chains x - w -> y and x - z -> y with w and z not
+    # adjacent
+    neighbors_x = graph.undirected_neighbors({x})
+    for z, w in combinations(parents_y.intersection(neighbors_x), 2):
+        if not graph.is_adjacent(z, w):
+            return True
+
+    # R4: there are two chains x - w -> z and w -> z -> y such that w and y
+    # are not adjacent and x and z are adjacent
+    for z in parents_y:
+        if graph.is_adjacent(x, z):
+            for w in _directed_parents(graph, z).intersection(neighbors_x):
+                if not graph.is_adjacent(w, y):
+                    return True
+    return False
+
+
+def apply_meek_rules(graph, edges=None):
+    """Orients the undirected edges of `graph` with the rules R1 to R4 until
+    none of them applies.
+
+    The undirected edges to examine are kept in a worklist. Orienting x -> y
+    can only make a rule apply to the undirected edges touching x, y or a
+    child of y, so only those are queued again.
+
+    :param edges: the edges (x, y) to examine first, all the undirected
+        edges by default. When the rules no longer apply anywhere else,
+        e.g. after a local change, the edges around the change are enough.
+    :return: the list of the edges (x, y) oriented as x -> y, in order
+    """
+    if edges is None:
+        edges = ((x, y) for x, y, _ in graph.edges() if graph.is_undirected(x, y))
+    to_visit = deque(dict.fromkeys(edges))
+    queued = set(to_visit)
+    oriented = []
+    while len(to_visit) > 0:
+        x, y = to_visit.popleft()
+        queued.discard((x, y))
+        if not graph.is_undirected(x, y) or not _meek_rule_applies(graph, x, y):
+            continue
+        graph.del_edge(y, x)
+        oriented.append((x, y))
+        # x -> y can be the z -> x of R1, the x -> z or z -> y of R2, the
+        # w -> y of R3, and the z -> y or w -> z of R4
+        affected = {x, y}.union(z for z in graph.children({y}) if graph.edge(z, y) is None)
+        for u in affected:
+            for v in graph.undirected_neighbors({u}):
+                for edge in ((u, v), (v, u)):
+                    if edge not in queued:
+                        queued.add(edge)
+                        to_visit.append(edge)
+    return oriented
+
+
+def orient_edges(graph, sep_set):
+    """Orientation phase of the PC algorithm: orients the colliders of the
+    skeleton `graph` (with undirected edges in both directions) given the
+    separating sets of the removed edges, then applies Meek's rules.
+    """
+    orient_colliders(graph, sep_set)
+    apply_meek_rules(graph)
+
+
+def consistent_extension(pdag):
+    """Returns a DAG with the skeleton, the directed edges and the
+    v-structures of the partially directed graph `pdag` (Dor and Tarsi
+    1992), by removing sinks whose undirected neighbors are adjacent to all
+    their other adjacencies.
+    """
+    dag = pdag.copy()
+    remaining = pdag.copy()
+    while len(remaining.nodes()) > 0:
+        removed = False
+        for y in remaining.nodes():
+            if any(remaining.is_directed(y, z) for z in remaining.children({y})):
+                continue
+            neighbors = remaining.undirected_neighbors({y})
+            adjacent = remaining.neighbors({y})
+            if all(remaining.is_adjacent(u, v) for u in neighbors for v in adjacent if u != v):
+                for u in neighbors:
+                    dag.del_edge(y, u)
+                remaining.del_node(y)
+                removed = True
+        if not removed:
+            raise ValueError("The graph has no consistent extension")
+    return dag
+
+
+def pdag_to_cpdag(pdag):
+    """Returns the CPDAG of the Markov equivalence class of a consistent
+    extension of `pdag` (such as a DAG): its skeleton with the v-structures
+    oriented, completed by Meek's rules.
+    """
+    dag = consistent_extension(pdag)
+    res = dag.undirected().copy()
+    for z in dag.nodes():
+        for x, y in combinations(dag.parents({z}), 2):
+            if not dag.is_adjacent(x, y):
+                res.del_edge(z, x)
+                res.del_edge(z, y)
+    apply_meek_rules(res)
+    return res
+
+
+def _clique_extensions(graph, clique, candidates, max_size):
+    """Yields the subsets T of `candidates` of at most `max_size` members
+    such that `clique` and T form a clique of `graph`.
+    """
+    stack = [((), 0)]
+    while len(stack) > 0:
+        T, start = stack.pop()
+        yield T
+        if len(T) < max_size:
+            for k in range(start, len(candidates)):
+                t = candidates[k]
+                if all(graph.is_adjacent(t, u) for u in chain(clique, T)):
+                    stack.append((T + (t,), k + 1))
+
+
+def _is_clique(graph, nodes):
+    return all(graph.is_adjacent(u, v) for u, v in combinations(nodes, 2))
+
+
+def _insert_operators(graph, y, order, max_parents):
+    """Valid-clique operators Insert(x, y, T) of Chickering (2002) adding
+    x -> y and orienting t -> y for t in T, as tuples
+    (x, T, NA_yx + T, old parents, new parents) where NA_yx are the
+    undirected neighbors of y adjacent to x.
+    """
+    parents_y = _directed_parents(graph, y)
+    neighbors_y = graph.undirected_neighbors({y})
+    adjacent_y = graph.neighbors({y})
+    res = []
+    for x in graph.nodes():
+        if x == y or x in adjacent_y:
+            continue
+        NA = {z for z in neighbors_y if graph.is_adjacent(z, x)}
+        max_size = len(neighbors_y)
+        if max_parents is not None:
+            max_size = max_parents - len(parents_y) - len(NA) - 1
+        if max_size < 0 or not _is_clique(graph, NA):
+            continue
+        candidates = sorted(neighbors_y.difference(NA), key=order.get)
+        for T in _clique_extensions(graph, NA, candidates, max_size):
+            S = NA.union(T)
+            old = frozenset(parents_y.union(S))
+            res.append((x, T, S, old, old.union({x})))
+    return res
+
+
+def _delete_operators(graph, y, order):
+    """Operators Delete(x, y, H) of Chickering (2002) removing the edge
+    x -> y or x - y and orienting y -> h (and x -> h) for h in H, as tuples
+    (x, H, NA_yx - H, old parents, new parents).
+    """
+    parents_y = _directed_parents(graph, y)
+    neighbors_y = graph.undirected_neighbors({y})
+    res = []
+    for x in sorted(graph.parents({y}), key=order.get):
+        NA = sorted((z for z in neighbors_y if z != x and graph.is_adjacent(z, x)), key=order.get)
+        # NA - H must be a clique
+        for C in _clique_extensions(graph, (), NA, len(NA)):
+            old = frozenset(parents_y.union(C, {x}))
+            res.append((x, tuple(z for z in NA if z not in C), set(C), old, old.difference({x})))
+    return res
+
+
+def _has_semi_directed_path(graph, start, end, blocked):
+    """True if there is a path start -> ... -> end or with undirected edges
+    avoiding the nodes in `blocked`.
+    """
+    visited = {start}
+    stack = [start]
+    while len(stack) > 0:
+        for v in graph.children({stack.pop()}):
+            if v == end:
+                return True
+            if v not in visited and v not in blocked:
+                visited.add(v)
+                stack.append(v)
+    return False
+
+
+def _local_score_many(score, families):
+    return score.local_score_many(families)
+
+
+# Score of a worker process, sent once when the process starts instead of
+# with every chunk, as its cache grows during the search
+_worker_score = None
+
+def _init_worker_score(score):
+    global _worker_score
+    _worker_score = score
+
+
+def _worker_local_score_many(families):
+    return _worker_score.local_score_many(families)
+
+
+def _score_families(score, families, executor, n_jobs):
+    """Local scores of a sequence of families (node, parents), computing
+    the ones not cached by `score` in chunks on the workers.
+    """
+    if executor is not None:
+        missing = score.missing(families)
+        if len(missing) >= n_jobs:
+            chunk_size = -(-len(missing) // n_jobs)
+            chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+            if isinstance(executor, ProcessPoolExecutor):
+                results = executor.map(_worker_local_score_many, chunks)
+            else:
+                results = executor.map(_local_score_many, repeat(score), chunks)
+            scores = [s for chunk in results for s in chunk]
+            score.store(missing, scores)
+    return score.local_score_many(families)
+
+
+def _greedy_phase(graph, score, forward, max_parents, executor, n_jobs):
+    """Applies the best scoring valid operator (insertions if `forward`,
+    deletions otherwise) to the CPDAG `graph` until none improves the
+    score, and returns the final CPDAG.
+
+    The improving operators of every target node y are kept sorted. An
+    operator on y only depends on the edges between y, its adjacencies and
+    the other endpoint, so after a step only the targets which are or were
+    adjacent to a node whose edges changed are rescored.
+    """
+    nodes = graph.nodes()
+    order = {node: k for k, node in enumerate(nodes)}
+    operators = {}
+    dirty = set(nodes)
+    while True:
+        candidates = {y: _insert_operators(graph, y, order, max_parents) if forward else _delete_operators(graph, y, order)
+                      for y in nodes if y in dirty}
+        families = [(y, parents) for y, ops in candidates.items() for op in ops for parents in op[3:]]
+        scores = iter(_score_families(score, families, executor, n_jobs))
+        for y, ops in candidates.items():
+            improving = []
+            for x, subset, S, old, new in ops:
+                old_score, new_score = next(scores), next(scores)
+                delta = new_score - old_score
+                if delta > 0:
+                    improving.append((delta, y, x, subset, S))
+            improving.sort(key=lambda op: -op[0])
+            operators[y] = improving
+
+        best = None
+        for delta, y, x, subset, S in merge(*(operators[y] for y in nodes), key=lambda op: -op[0]):
+            if not forward or not _has_semi_directed_path(graph, y, x, S):
+                best = (x, y, subset)
+                break
+        if best is None:
+            return graph
+
+        x, y, subset = best
+        old_edges = {(begin, end) for begin, end, _ in graph.edges()}
+        if forward:
+            graph.add_edge(x, y)
+            for t in subset:
+                graph.del_edge(y, t)
+        else:
+            graph.del_edge(x, y)
+            graph.del_edge(y, x)
+            for h in subset:
+                graph.del_edge(h, y)
+                if graph.is_undirected(x, h):
+                    graph.del_edge(h, x)
+        old_graph = graph
+        graph = pdag_to_cpdag(graph)
+
+        new_edges = {(begin, end) for begin, end, _ in graph.edges()}
+        changed = {node for edge in old_edges.symmetric_difference(new_edges) for node in edge}
+        dirty = changed.union(old_graph.neighbors(changed), graph.neighbors(changed))
+
+
+def ges_algorithm(data, score, initial_graph=None, max_parents=None, n_jobs=1, backend="process"):
+    """Greedy Equivalence Search (Chickering 2002), returning the estimated
+    CPDAG as a CausalGraph where undirected edges are represented in both
+    directions.
+
+    Starting from the empty graph, the forward phase inserts edges and the
+    backward phase deletes edges, each time applying the operator of the
+    equivalence class which increases the score the most.
+
+    :param data: data matrix, only used for its number of columns when
+        `initial_graph` is None
+    :param score: decomposable score with a method
+        `local_score_many(families)` returning the local scores of pairs
+        (node, parents), such as `GaussianBICScore`. It should cache them,
+        as most of them are queried again at the next steps.
+    :param initial_graph: CPDAG to start from, the empty graph over
+        V0, V1, ... by default
+    :param max_parents: maximal number of parents of a node in the forward
+        phase, or None
+    :param n_jobs: number of workers computing the missing local scores of
+        a step in parallel. The score must then also have the methods
+        `missing(families)` and `store(families, scores)`.
+    :param backend: "process" or "thread", the kind of pool of workers.
+        The local scores are mostly computed in Python, so threads give no
+        speedup. Each process receives a copy of the score when it starts.
+    """
+    if initial_graph is None:
+        graph = CausalGraph()
+        for i in range(data.shape[1]):
+            graph.add_node("V" + str(i))
+    else:
+        graph = initial_graph
+
+    executor = None
+    if n_jobs > 1:
+        if backend == "process":
+            executor = ProcessPoolExecutor(n_jobs, initializer=_init_worker_score, initargs=(score,))
+        elif backend == "thread":
+            executor = ThreadPoolExecutor(n_jobs)
+        else:
+            raise ValueError("Unknown backend " + str(backend))
+
+    try:
+        graph = _greedy_phase(graph, score, True, max_parents, executor, n_jobs)
+        graph = _greedy_phase(graph, score, False, max_parents, executor, n_jobs)
+    finally:
+        if executor is not None:
+            executor.shutdown()
     return graph
-    
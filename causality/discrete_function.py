@@ -1,9 +1,38 @@
 from functools import reduce
 from typing import Sequence
 import numpy as np
+from causality.cache import BoundedCache
 from causality.variable import Variable
 from causality.discrete_set import DiscreteSet
 
+# Preimage arrays keyed by (function, supports of the inputs and output),
+# shared by the equal functions on equal supports, e.g. the twin copies of
+# a function
+_preimage_cache = BoundedCache(max_entries=1024, max_bytes=2**28)
+
+
+def _support_array(support) -> np.ndarray:
+    """The values of a support as a numpy array of the original Python
+    objects, so that operators on it behave as on each value (e.g.
+    True + True is 2, not True).
+    """
+    res = np.empty(len(support), dtype=object)
+    res[:] = list(support)
+    return res
+
+
+def _xor(*values):
+    return reduce(np.logical_xor, values)
+
+
+def _and(*values):
+    return reduce(np.logical_and, values)
+
+
+def _or(*values):
+    return reduce(np.logical_or, values)
+
+
 class DiscreteFunction:
     def __init__(self, function, inputs: Sequence[Variable], output: Variable):
         """Constructor.
@@ -20,19 +49,61 @@ class DiscreteFunction:
         self.output = output
         self.total_variables = self.inputs + (output,)
         self.total_dim = tuple(len(v.support) for v in self.total_variables)
-        self.preimage = self._compute_preimage()
-        
-    def _compute_preimage(self):
-        res = DiscreteSet(self.total_variables, np.full(self.total_dim, False))
-        with np.nditer(res.values, flags=["multi_index"], op_flags=["readwrite"]) as it:
+        self._preimage = None
+
+    @property
+    def preimage(self) -> DiscreteSet:
+        """Set of the values of the inputs and output such that the output
+        is the image of the inputs. It is computed on first use, and its
+        array is read-only as it is shared with the equal functions on
+        equal supports.
+        """
+        if self._preimage is None:
+            key = (self.function,) + tuple(tuple(v.support) for v in self.total_variables)
+            values = _preimage_cache.get(key)
+            if values is None:
+                values = self._compute_preimage()
+                values.flags.writeable = False
+                _preimage_cache[key] = values
+            self._preimage = DiscreteSet(self.total_variables, values)
+        return self._preimage
+
+    def _compute_preimage(self) -> np.ndarray:
+        values = self._compute_preimage_vectorized()
+        if values is None:
+            values = self._compute_preimage_by_cells()
+        return values
+
+    def _compute_preimage_vectorized(self):
+        """Calls the function once on the grid of all the values of the
+        inputs, as broadcast arrays. Returns None if the function fails on
+        arrays or does not return one image per cell.
+        """
+        supports = [_support_array(v.support) for v in self.total_variables]
+        grid = np.meshgrid(*supports[:-1], indexing="ij", sparse=True)
+        grid = np.broadcast_arrays(*grid) if len(grid) > 0 else []
+        try:
+            image = np.asarray(self.function(*grid))
+            if image.shape != self.total_dim[:-1]:
+                return None
+            res = image[..., np.newaxis] == supports[-1]
+        except Exception:
+            return None
+        if not isinstance(res, np.ndarray) or res.shape != self.total_dim:
+            return None
+        return res.astype(bool)
+
+    def _compute_preimage_by_cells(self) -> np.ndarray:
+        res = np.full(self.total_dim, False)
+        with np.nditer(res, flags=["multi_index"], op_flags=["readwrite"]) as it:
             for value in it:
-                values = [res.dimensions[dim].support[val_i] \
+                values = [self.total_variables[dim].support[val_i] \
                     for dim, val_i in enumerate(it.multi_index)]
                 input_values = values[:-1]
                 output_value = values[-1]
                 image = self.function(*input_values)
                 if output_value == image:
-                    res.values[it.multi_index] = True
+                    res[it.multi_index] = True
         return res
 
 
@@ -45,7 +116,7 @@ class Xor(DiscreteFunction):
         :param output: The output `Variable`
         """
         super().__init__(
-            lambda *values: reduce(lambda a, b: np.logical_xor(a, b), values),
+            _xor,
             inputs,
             output
         )
@@ -60,7 +131,7 @@ class And(DiscreteFunction):
         :param output: The output `Variable`
         """
         super().__init__(
-            lambda *values: reduce(lambda a, b: np.logical_and(a, b), values),
+            _and,
             inputs,
             output
         )
@@ -75,7 +146,7 @@ class Or(DiscreteFunction):
         :param output: The output `Variable`
         """
         super().__init__(
-            lambda *values: reduce(lambda a, b: np.logical_or(a, b), values),
+            _or,
             inputs,
             output
         )
@@ -83,7 +154,7 @@ class Or(DiscreteFunction):
 class Not(DiscreteFunction):
     def __init__(self, input_: Variable, output: Variable):
         super().__init__(
-            lambda value: np.logical_not(value),
+            np.logical_not,
             [input_],
             output
         )
@@ -26,17 +26,20 @@ class DiscreteSet:
     def tensor(self, other, axis: Variable):
         """Tensor product of both sets, where the sum is over `axis`.
         Dimensions common to `self` and `other` are collapsed into one.
+        Neither set is modified, so that they can be shared (e.g. the
+        preimages of functions).
         """
-        
-        common_dimensions = self._match_to_tensor(other, axis)
+        left = DiscreteSet(self.dimensions, self.values)
+        right = DiscreteSet(other.dimensions, other.values)
+        common_dimensions = left._match_to_tensor(right, axis)
         common_size = reduce(mul, (len(dim.support) for dim in common_dimensions), 1)
-        self_values = self.values.reshape((len(axis.support), common_size, -1))
-        other_values = other.values.reshape((len(axis.support), common_size, -1))
+        left_values = left.values.reshape((len(axis.support), common_size, -1))
+        right_values = right.values.reshape((len(axis.support), common_size, -1))
 
-        values = np.einsum("ijk,ijl->jkl", self_values, other_values)
+        values = np.einsum("ijk,ijl->jkl", left_values, right_values)
         dimensions = tuple(common_dimensions) \
-                + self.dimensions[len(common_dimensions) + 1:] \
-                + other.dimensions[len(common_dimensions) + 1:]
+                + left.dimensions[len(common_dimensions) + 1:] \
+                + right.dimensions[len(common_dimensions) + 1:]
         values = values.reshape(tuple(len(dim.support) for dim in dimensions))
         return DiscreteSet(dimensions, values)
     
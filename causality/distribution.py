@@ -1,4 +1,4 @@
-from typing import Mapping, Any
+from typing import Mapping, Any, Sequence
 import numpy as np
 from causality.variable import Variable
 from causality.discrete_set import DiscreteSet
@@ -13,6 +13,8 @@ class IndependentDistribution:
         """ 
         self.dists = dists
         self.generator = np.random.default_rng(seed)
+        # pmf of every variable on its support, see `pmf_vector`
+        self._pmf_vectors = {}
      
     def rvs(self, size: int) -> dict[Variable, np.ndarray]:
         """Generates a number of random samples of the distribution.
@@ -24,6 +26,29 @@ class IndependentDistribution:
         return {var: dist.rvs(size=size, random_state=self.generator) \
                 for var, dist in self.dists.items()}
     
+    def pmf_vector(self, var: Variable) -> np.ndarray:
+        """Returns the probability of every value in the support of `var`,
+        computed once.
+        """
+        res = self._pmf_vectors.get(var)
+        if res is None:
+            res = np.array([self.dists[var].pmf(value) for value in var.support], dtype=float)
+            self._pmf_vectors[var] = res
+        return res
+
+    def _contract(self, dimensions, values: np.ndarray, batch: bool) -> np.ndarray:
+        """Sums the product of the pmf vectors of `dimensions` over the
+        cells of `values`, after a leading batch axis if `batch`.
+        """
+        assert all(var in self.dists for var in dimensions)
+        offset = 1 if batch else 0
+        operands = [values, list(range(values.ndim))]
+        for axis, var in enumerate(dimensions, start=offset):
+            operands += [self.pmf_vector(var), [axis]]
+        res = np.einsum(*operands, list(range(offset)))
+        assert np.all(res <= 1 + 1e-9)
+        return res
+
     def pmf(self, set_: DiscreteSet) -> float:
         """Computes the probability of observing the given set of
         values.
@@ -32,15 +57,17 @@ class IndependentDistribution:
         have the same dimensions as `self.dist.keys()`
         :return: The probability of the set of values
         """
-        assert all(var in self.dists for var in set_.dimensions)
-        proba_total = 0
-        it = np.nditer(set_.values, flags=["multi_index"])
-        for has_values in it:
-            if has_values:
-                proba_atom = 1
-                for dim, val_i in enumerate(it.multi_index):
-                    var = set_.dimensions[dim]
-                    proba_atom *= self.dists[var].pmf(var.support[val_i])
-                proba_total += proba_atom
-        assert proba_total <= 1
-        return proba_total
+        return float(self._contract(set_.dimensions, set_.values, False))
+
+    def pmf_many(self, sets: Sequence[DiscreteSet]) -> np.ndarray:
+        """Probabilities of a sequence of sets, like `pmf`. The sets with
+        the same dimensions are stacked and contracted at once.
+        """
+        res = np.empty(len(sets))
+        by_dimensions = {}
+        for k, set_ in enumerate(sets):
+            by_dimensions.setdefault(set_.dimensions, []).append(k)
+        for dimensions, positions in by_dimensions.items():
+            values = np.stack([sets[k].values for k in positions])
+            res[positions] = self._contract(dimensions, values, True)
+        return res
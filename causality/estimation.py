@@ -0,0 +1,198 @@
+from functools import reduce
+from operator import mul
+from typing import Mapping, Sequence
+import numpy as np
+from causality.variable import Variable
+from causality.expression import ProbabilityExpr, SummationExpr, ProductExpr, ConjunctionExpr
+
+
+class Factor:
+    def __init__(self, variables: Sequence[str], values: np.ndarray, levels: Sequence[np.ndarray]):
+        """Constructor.
+
+        :param variables: the names of the axes of `values`
+        :param values: array of probabilities (or products of
+            probabilities), with one axis per variable
+        :param levels: for each variable, the array of its values in the
+            data, in the order of the corresponding axis
+        """
+        self.variables = tuple(variables)
+        self.values = values
+        self.levels = tuple(levels)
+
+    def __str__(self):
+        return "Factor(" + ", ".join(self.variables) + ")\n" + str(self.values)
+
+    def get(self, assignment: Mapping[str, object]) -> float:
+        """Returns the entry for the values of the variables given in
+        `assignment` (a dict `{name: value}`, with one entry per variable).
+        """
+        index = tuple(int(np.flatnonzero(levels == assignment[var])[0])
+                      for var, levels in zip(self.variables, self.levels))
+        return self.values[index]
+
+
+class Estimator:
+    def __init__(self, data_matrix: np.ndarray, column_names: Sequence[str]):
+        """Evaluates expressions returned by
+        `causality.identification.closed_form` against observational data.
+
+        Every column is integer-coded once. The joint count tables needed by
+        an expression are then built with one `np.bincount` each, the
+        smaller tables are obtained by summing them, and the sums of products
+        are computed as einsum contractions.
+
+        :param data_matrix: array of shape (n_samples, n_columns) of
+            discrete values
+        :param column_names: the variable name of every column
+        """
+        self.inv_names = {name: i for i, name in enumerate(column_names)}
+        self.n = data_matrix.shape[0]
+        self.levels = []
+        self.codes = []
+        for i in range(data_matrix.shape[1]):
+            levels, codes = np.unique(data_matrix[:, i], return_inverse=True)
+            self.levels.append(levels)
+            self.codes.append(codes.reshape(-1).astype(np.int64))
+        # Count tables keyed by a sorted tuple of column indices, and
+        # conditional tables keyed by the column indices of both sides
+        self.count_tables = {}
+        self.conditional_tables = {}
+
+    @classmethod
+    def from_columns(cls, columns: Mapping[object, np.ndarray]):
+        """Builds an estimator from a dict `{variable: array}`, such as
+        the samples of `CausalModel.rvs`. Variables are named with `str`.
+        """
+        names = [str(var) for var in columns]
+        return cls(np.column_stack(list(columns.values())), names)
+
+    def _column(self, name: str) -> int:
+        """Column of a variable name, where the primes added by
+        `make_prime` are ignored.
+        """
+        base = name
+        while base not in self.inv_names and base.endswith("'"):
+            base = base[:-1]
+        if base not in self.inv_names:
+            raise KeyError("No column for variable " + name)
+        return self.inv_names[base]
+
+    def _names(self, expression) -> list[str]:
+        """Names of the variables of a conjunction of variables."""
+        if expression is None:
+            return []
+        if isinstance(expression, ConjunctionExpr):
+            return sorted(name for e in expression.expressions for name in self._names(e))
+        if isinstance(expression, Variable):
+            return [str(expression)]
+        if isinstance(expression, str):
+            return [expression]
+        raise TypeError("Can't evaluate the variables of " + str(expression))
+
+    def _probability_terms(self, expression):
+        """All the ProbabilityExpr in an expression tree."""
+        if isinstance(expression, ProbabilityExpr):
+            return [expression]
+        if isinstance(expression, SummationExpr):
+            return self._probability_terms(expression.expression)
+        if isinstance(expression, ProductExpr):
+            return [p for e in expression.expressions for p in self._probability_terms(e)]
+        raise TypeError("Can't evaluate " + str(expression))
+
+    def _columns(self, term: ProbabilityExpr):
+        return tuple(sorted({self._column(name) for name in
+                             self._names(term.expression) + self._names(term.condition)}))
+
+    def compile(self, expression):
+        """Builds the count tables needed by `expression`. Only the tables
+        that are not contained in another needed table are counted from the
+        data, so this is one pass over the data per maximal set of variables.
+        """
+        needed = {self._columns(term) for term in self._probability_terms(expression)}
+        maximal = [cols for cols in needed
+                   if not any(set(cols) < set(other) for other in needed)]
+        for cols in maximal:
+            if not any(set(cols) <= set(other) for other in self.count_tables):
+                self._count(cols)
+
+    def _count(self, cols):
+        shape = tuple(len(self.levels[c]) for c in cols)
+        code = np.zeros(self.n, dtype=np.int64)
+        for c, size in zip(cols, shape):
+            code *= size
+            code += self.codes[c]
+        size = reduce(mul, shape, 1)
+        self.count_tables[cols] = np.bincount(code, minlength=size).reshape(shape)
+        return self.count_tables[cols]
+
+    def counts(self, cols) -> np.ndarray:
+        """Joint count table of the sorted column indices `cols`, summed
+        from a cached larger table when possible.
+        """
+        cols = tuple(cols)
+        if cols in self.count_tables:
+            return self.count_tables[cols]
+        supersets = [other for other in self.count_tables if set(cols) <= set(other)]
+        if len(supersets) == 0:
+            return self._count(cols)
+        # Sum the smallest table containing cols
+        other = min(supersets, key=lambda o: self.count_tables[o].size)
+        axes = tuple(i for i, c in enumerate(other) if c not in cols)
+        self.count_tables[cols] = self.count_tables[other].sum(axis=axes)
+        return self.count_tables[cols]
+
+    def _probability(self, term: ProbabilityExpr) -> Factor:
+        if term.intervention is not None:
+            raise ValueError("Can't estimate an interventional probability from data")
+        names_E = self._names(term.expression)
+        names_C = [name for name in self._names(term.condition) if name not in names_E]
+        names = names_E + names_C
+        cols = [self._column(name) for name in names]
+        key = (tuple(cols[:len(names_E)]), tuple(cols[len(names_E):]))
+        if key not in self.conditional_tables:
+            sorted_cols = tuple(sorted(set(cols)))
+            counts = self.counts(sorted_cols)
+            # Reorder the axes as in names
+            counts = np.transpose(counts, [sorted_cols.index(c) for c in cols])
+            denominator = counts.sum(axis=tuple(range(len(names_E))), keepdims=True)
+            # Conditional probabilities given a value never observed are
+            # set to 0
+            self.conditional_tables[key] = np.divide(
+                counts, denominator,
+                out=np.zeros(counts.shape),
+                where=denominator > 0
+            )
+        return Factor(names, self.conditional_tables[key], [self.levels[c] for c in cols])
+
+    def _factors(self, expression) -> list[Factor]:
+        """Evaluates an expression as a list of factors to multiply."""
+        if isinstance(expression, ProductExpr):
+            return [f for e in expression.expressions for f in self._factors(e)]
+        return [self.evaluate(expression)]
+
+    def _contract(self, factors, summed):
+        labels = {}
+        levels = {}
+        operands = []
+        for factor in factors:
+            for var, lev in zip(factor.variables, factor.levels):
+                labels.setdefault(var, len(labels))
+                levels[var] = lev
+            operands += [factor.values, [labels[var] for var in factor.variables]]
+        output = [var for var in labels if var not in summed]
+        values = np.einsum(*operands, [labels[var] for var in output], optimize=True)
+        return Factor(output, values, [levels[var] for var in output])
+
+    def evaluate(self, expression) -> Factor:
+        """Evaluates a ProbabilityExpr, SummationExpr or ProductExpr, and
+        returns a `Factor` over its free variables.
+        """
+        self.compile(expression)
+        if isinstance(expression, ProbabilityExpr):
+            return self._probability(expression)
+        if isinstance(expression, SummationExpr):
+            return self._contract(self._factors(expression.expression), set(self._names(expression.indices)))
+        if isinstance(expression, ProductExpr):
+            return self._contract(self._factors(expression), set())
+        raise TypeError("Can't evaluate " + str(expression))
@@ -1,45 +1,648 @@
-from typing import Sequence
+from typing import Sequence, Iterable
+from itertools import islice
 from math import sqrt, log1p
 import numpy as np
 from scipy.stats import norm
+from causality.cache import BoundedCache
+
+
+def iter_chunks(source, chunk_size: int = 100000, delimiter: str = ",", skiprows: int = 1) -> Iterable[np.ndarray]:
+    """Yields blocks of rows of a data source without loading it whole.
+
+    :param source: a path to a `.npy` file (memory-mapped), a path to a
+        CSV file (read `chunk_size` lines at a time, after `skiprows`
+        header lines), an array or memory-mapped array (sliced), or any
+        iterable of 2D arrays (returned as is)
+    """
+    if isinstance(source, str) and source.endswith(".npy"):
+        source = np.load(source, mmap_mode="r")
+    if isinstance(source, str):
+        with open(source) as file:
+            for _ in range(skiprows):
+                next(file)
+            while True:
+                lines = list(islice(file, chunk_size))
+                if len(lines) == 0:
+                    return
+                yield np.loadtxt(lines, delimiter=delimiter, ndmin=2)
+    elif isinstance(source, np.ndarray):
+        for start in range(0, source.shape[0], chunk_size):
+            yield np.asarray(source[start:start + chunk_size], dtype=float)
+    else:
+        yield from source
+
+
+class SufficientStatistics:
+    def __init__(self, n_columns: int):
+        """Number of samples, mean vector and scatter matrix (sum of the
+        outer products of the deviations to the mean) of a data set, updated
+        chunk by chunk (Chan, Golub and LeVeque's pairwise update).
+        """
+        self.n = 0
+        self.mean = np.zeros(n_columns)
+        self.scatter = np.zeros((n_columns, n_columns))
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[np.ndarray]):
+        res = None
+        for chunk in chunks:
+            if res is None:
+                res = cls(chunk.shape[1])
+            res.update(chunk)
+        return res
+
+    def update(self, chunk: np.ndarray):
+        """Adds the rows of `chunk` to the statistics."""
+        chunk = np.asarray(chunk, dtype=float)
+        n_chunk = chunk.shape[0]
+        if n_chunk == 0:
+            return
+        mean_chunk = chunk.mean(axis=0)
+        deviations = chunk - mean_chunk
+        self._merge(n_chunk, mean_chunk, deviations.T @ deviations)
+
+    def merge(self, other):
+        """Adds the statistics of another data set with the same columns."""
+        self._merge(other.n, other.mean, other.scatter)
+
+    def _merge(self, n, mean, scatter):
+        total = self.n + n
+        delta = mean - self.mean
+        self.scatter = self.scatter + scatter + np.outer(delta, delta) * (self.n * n / total)
+        self.mean = self.mean + delta * (n / total)
+        self.n = total
+
+    def covariance(self) -> np.ndarray:
+        return self.scatter / (self.n - 1)
+
+    def correlation(self) -> np.ndarray:
+        std = np.sqrt(np.diag(self.scatter))
+        return self.scatter / np.outer(std, std)
+
+
+class LazyCorrelation:
+    def __init__(self, data, block_size: int = 256, max_blocks: int = 256, chunk_size: int = 100000):
+        """Correlation matrix of the columns of `data`, computed by blocks
+        of `block_size` x `block_size` columns when they are first needed,
+        instead of as a dense matrix. The data is read chunk by chunk: once
+        for the means and standard deviations, then once per batch of
+        missing blocks.
+
+        It can be indexed like a numpy array with integers or integer
+        arrays (`corr[i, j]`, `corr[I, J]`), but not with slices.
+
+        :param data: array, memory-mapped array or path to a `.npy` file
+            of shape (n_samples, n_columns)
+        :param max_blocks: number of blocks kept in a least recently used
+            cache, see `blocks`
+        :param chunk_size: number of rows read at once
+        """
+        if isinstance(data, str):
+            data = np.load(data, mmap_mode="r")
+        self.data = data
+        self.block_size = block_size
+        self.chunk_size = chunk_size
+        self.n_columns = data.shape[1]
+        self.n_blocks = -(-self.n_columns // block_size)
+        self.blocks = BoundedCache(max_entries=max_blocks)
+
+        # Means and population standard deviations, merged chunk by chunk
+        self.n = 0
+        self.mean = np.zeros(self.n_columns)
+        sum_squares = np.zeros(self.n_columns)
+        for chunk in iter_chunks(data, chunk_size):
+            n_chunk = chunk.shape[0]
+            mean_chunk = chunk.mean(axis=0)
+            delta = mean_chunk - self.mean
+            total = self.n + n_chunk
+            sum_squares += ((chunk - mean_chunk)**2).sum(axis=0) + delta**2 * (self.n * n_chunk / total)
+            self.mean += delta * (n_chunk / total)
+            self.n = total
+        self.std = np.sqrt(sum_squares / self.n)
+
+    @property
+    def shape(self):
+        return (self.n_columns, self.n_columns)
+
+    def correlation(self):
+        return self
+
+    def _columns(self, block: int) -> slice:
+        return slice(block * self.block_size, min((block + 1) * self.block_size, self.n_columns))
+
+    def _compute_blocks(self, pairs):
+        """Computes the blocks (a, b), a <= b, in one pass over the data."""
+        pairs = [pair for pair in pairs if pair not in self.blocks]
+        if len(pairs) == 0:
+            return
+        needed = sorted({a for pair in pairs for a in pair})
+        sums = {pair: 0 for pair in pairs}
+        for start in range(0, self.n, self.chunk_size):
+            rows = slice(start, start + self.chunk_size)
+            standardized = {}
+            for a in needed:
+                cols = self._columns(a)
+                standardized[a] = (np.asarray(self.data[rows, cols], dtype=float) - self.mean[cols]) / self.std[cols]
+            for a, b in pairs:
+                sums[(a, b)] = sums[(a, b)] + standardized[a].T @ standardized[b]
+        for pair in pairs:
+            self.blocks[pair] = sums[pair] / self.n
+
+    def prefetch(self, column_groups):
+        """Computes in one pass the blocks holding the correlations between
+        the columns of each group (a sequence of sequences of column
+        indices), if they all fit in the cache.
+        """
+        pairs = set()
+        for group in column_groups:
+            blocks = sorted({c // self.block_size for c in group})
+            pairs.update((a, b) for i, a in enumerate(blocks) for b in blocks[i:])
+        if self.blocks.max_entries is None or len(pairs) <= self.blocks.max_entries:
+            self._compute_blocks(pairs)
+
+    def __getitem__(self, index):
+        I, J = np.broadcast_arrays(*(np.asarray(k) for k in index))
+        block_I = I // self.block_size
+        block_J = J // self.block_size
+        # Only the blocks (a, b) with a <= b are stored, the other ones are
+        # their transposes
+        swap = block_I > block_J
+        rows = np.where(swap, J, I)
+        cols = np.where(swap, I, J)
+        keys = np.minimum(block_I, block_J) * self.n_blocks + np.maximum(block_I, block_J)
+        unique_keys = np.unique(keys)
+        self._compute_blocks([divmod(int(key), self.n_blocks) for key in unique_keys])
+
+        res = np.empty(I.shape)
+        for key in unique_keys:
+            a, b = divmod(int(key), self.n_blocks)
+            block = self.blocks.get((a, b))
+            if block is None:
+                # Evicted by the other blocks of this query
+                self._compute_blocks([(a, b)])
+                block = self.blocks.get((a, b))
+            mask = keys == key
+            res[mask] = block[rows[mask] - a * self.block_size, cols[mask] - b * self.block_size]
+        return res[()] if res.ndim == 0 else res
+
 
 class GaussianIndependenceTest:
-    def __init__(self, data_matrix: np.ndarray, column_names: Sequence[str]):
-        self.data_matrix = data_matrix
+    def __init__(
+            self,
+            data_matrix: np.ndarray,
+            column_names: Sequence[str],
+            method: str = "precision",
+            cache_entries: int = 2**20,
+            cache_bytes: int = None):
+        """Constructor.
+
+        :param data_matrix: array of shape (n_samples, n_columns)
+        :param column_names: the name of every column
+        :param method: "precision" to compute partial correlations from the
+            Cholesky factor of the correlation submatrix, or "recursive" to
+            use the recursive formula on conditioning sets
+        :param cache_entries: maximal number of cached partial correlations
+        :param cache_bytes: maximal memory used by the cached partial
+            correlations. The least recently used ones are evicted first,
+            see `partial_corr_cache`.
+        """
+        statistics = SufficientStatistics(data_matrix.shape[1])
+        statistics.update(data_matrix)
+        self._init_test(statistics, column_names, method, cache_entries, cache_bytes)
+
+    def _init_test(self, statistics, column_names, method, cache_entries, cache_bytes):
+        if method not in ("precision", "recursive"):
+            raise ValueError("Unknown method " + str(method))
+        # Only the sufficient statistics are kept, not the data
+        self.statistics = statistics
         self.inv_names = {name: i for i, name in enumerate(column_names)}
-        self.n = data_matrix.shape[0]
-        self.corr_matrix = np.corrcoef(data_matrix, rowvar=False)
-        self.partial_corr_dict = {}
+        self.method = method
+        # Keys are (i, j, mask) with i < j the column indices and mask the
+        # bitmask of the column indices of the conditioning set
+        self.partial_corr_cache = BoundedCache(cache_entries, cache_bytes)
+        self._update_correlation()
+
+    def _update_correlation(self):
+        self.n = self.statistics.n
+        self.corr_matrix = self.statistics.correlation()
+        self.partial_corr_cache.clear()
+
+    @classmethod
+    def from_statistics(
+            cls,
+            statistics: SufficientStatistics,
+            column_names: Sequence[str],
+            method: str = "precision",
+            cache_entries: int = 2**20,
+            cache_bytes: int = None):
+        """Builds the test from sufficient statistics (or from a
+        `LazyCorrelation`) instead of a data matrix. Other parameters are as
+        in the constructor.
+        """
+        res = cls.__new__(cls)
+        res._init_test(statistics, column_names, method, cache_entries, cache_bytes)
+        return res
+
+    @classmethod
+    def lazy(
+            cls,
+            data,
+            column_names: Sequence[str],
+            block_size: int = 256,
+            max_blocks: int = 256,
+            chunk_size: int = 100000,
+            **kwargs):
+        """Builds the test on a `LazyCorrelation` of `data` (an array,
+        memory-mapped array or `.npy` path) instead of a dense correlation
+        matrix, for data sets with many columns. Such a test can't be
+        updated with more data. Other keyword arguments are passed to the
+        constructor.
+        """
+        correlation = LazyCorrelation(data, block_size, max_blocks, chunk_size)
+        return cls.from_statistics(correlation, column_names, **kwargs)
+
+    def prefetch(self, column_groups: Sequence[Sequence[str]]):
+        """Prepares the correlations between the members of each group of
+        columns, when they are computed lazily. Called by `pc_algorithm`
+        with the adjacencies at the start of each level.
+        """
+        if isinstance(self.corr_matrix, LazyCorrelation):
+            self.corr_matrix.prefetch([[self.inv_names[c] for c in group] for group in column_groups])
+
+    @classmethod
+    def from_chunks(cls, source, column_names: Sequence[str], chunk_size: int = 100000, **kwargs):
+        """Builds the test from data read chunk by chunk, see `iter_chunks`
+        for the possible sources. The raw data is never kept in memory.
+        Other keyword arguments are passed to the constructor.
+        """
+        statistics = SufficientStatistics.from_chunks(iter_chunks(source, chunk_size))
+        return cls.from_statistics(statistics, column_names, **kwargs)
+
+    def update(self, source, chunk_size: int = 100000):
+        """Merges more data (in chunks, see `iter_chunks`) into the
+        statistics of the test. Cached partial correlations are discarded.
+        """
+        if isinstance(self.statistics, LazyCorrelation):
+            raise TypeError("A test on a LazyCorrelation can't be updated")
+        for chunk in iter_chunks(source, chunk_size):
+            self.statistics.update(chunk)
+        self._update_correlation()
 
     def log_q1pm(self, x):
         """Returns log((1 + x) / (1 - x)) in a numerically stable way."""
         return log1p(2 * x / (1 - x))
 
+    def _key(self, i: int, j: int, K: Sequence[int]):
+        mask = 0
+        for k in K:
+            mask |= 1 << k
+        return (min(i, j), max(i, j), mask)
+
     def partial_corr(self, i: str, j: str, K: Sequence[str]):
-        K = list(K)
+        if self.method == "precision":
+            return self.partial_corr_many([(i, j, K)])[0]
+        return self._partial_corr_recursive(
+            self.inv_names[i], self.inv_names[j], [self.inv_names[k] for k in K])
+
+    def _partial_corr_recursive(self, i: int, j: int, K: list[int]):
         if len(K) == 0:
-            return self.corr_matrix[self.inv_names[i], self.inv_names[j]]
+            return self.corr_matrix[i, j]
         else:
             # If the result is already cached
-            idx = (i, j, frozenset(sorted(K)))
-            if idx in self.partial_corr_dict:
-                return self.partial_corr_dict[idx]
+            idx = self._key(i, j, K)
+            res = self.partial_corr_cache.get(idx)
+            if res is not None:
+                return res
 
+            K = list(K)
             h = K.pop()
-            corr_i_h = self.partial_corr(i, h, K)
-            corr_j_h = self.partial_corr(j, h, K)
-            res = (self.partial_corr(i, j, K) - corr_i_h * corr_j_h) \
+            corr_i_h = self._partial_corr_recursive(i, h, K)
+            corr_j_h = self._partial_corr_recursive(j, h, K)
+            res = (self._partial_corr_recursive(i, j, K) - corr_i_h * corr_j_h) \
                 / sqrt((1 - corr_i_h**2) * (1 - corr_j_h**2))
             # Cache the result
-            #print("p-corr {} - {} | {} = {}".format(i, j, K + [h], res))
-            self.partial_corr_dict[idx] = res
+            self.partial_corr_cache[idx] = res
             return res
 
+    def _partial_corr_indices(self, indices: np.ndarray) -> np.ndarray:
+        """Partial correlations for an integer array of shape (m, k + 2),
+        where each row lists the k conditioning columns followed by the
+        two tested columns.
+        """
+        sub = self.corr_matrix[indices[:, :, None], indices[:, None, :]]
+        if indices.shape[1] == 2:
+            return sub[:, 0, 1]
+        try:
+            # The last 2x2 block of the Cholesky factor L is the Cholesky
+            # factor [[a, 0], [b, c]] of the covariance of (i, j) given K,
+            # so the partial correlation is ab / (a sqrt(b^2 + c^2))
+            L = np.linalg.cholesky(sub)
+            b = L[:, -1, -2]
+            c = L[:, -1, -1]
+            return b / np.sqrt(b**2 + c**2)
+        except np.linalg.LinAlgError:
+            # Singular submatrices, use the pseudo-inverse of each of them
+            P = np.linalg.pinv(sub, hermitian=True)
+            return -P[:, -2, -1] / np.sqrt(P[:, -2, -2] * P[:, -1, -1])
+
+    def partial_corr_many(self, tests: Sequence[tuple]) -> np.ndarray:
+        """Partial correlations of a sequence of triples (i, j, K), with one
+        batched Cholesky decomposition per size of K for the results that
+        are not cached.
+        """
+        res = np.empty(len(tests))
+        by_size = {}
+        for t, (i, j, K) in enumerate(tests):
+            indices = [self.inv_names[k] for k in K] + [self.inv_names[i], self.inv_names[j]]
+            key = self._key(indices[-2], indices[-1], indices[:-2])
+            cached = self.partial_corr_cache.get(key)
+            if cached is None:
+                by_size.setdefault(len(K), []).append((t, indices, key))
+            else:
+                res[t] = cached
+        for size, to_compute in by_size.items():
+            positions = [t for t, _, _ in to_compute]
+            indices = np.array([idx for _, idx, _ in to_compute], dtype=np.intp).reshape(len(positions), size + 2)
+            res[positions] = self._partial_corr_indices(indices)
+            for t, _, key in to_compute:
+                self.partial_corr_cache[key] = res[t]
+        return res
 
     def z_stat(self, i: str, j: str, K: Sequence[str]):
         r = self.partial_corr(i, j, K)
         return sqrt(self.n - len(K) - 3) * abs(0.5 * self.log_q1pm(r))
 
     def indep_test(self, i: str, j: str, K: Sequence[str]):
+        if self.method == "precision":
+            return self.indep_test_many([(i, j, K)])[0]
         z = self.z_stat(i, j, K)
         return 2 * (1 - norm.cdf(z))
+
+    def indep_test_many(self, tests: Sequence[tuple]) -> np.ndarray:
+        """p-values of a sequence of triples (i, j, K), like `indep_test`,
+        computed with a few vectorized numpy calls.
+        """
+        sizes = np.array([len(K) for _, _, K in tests], dtype=int)
+        if np.any(self.n - sizes - 3 <= 0):
+            raise ValueError("Conditioning sets of size up to {} need more than {} samples".format(
+                sizes.max(), sizes.max() + 3))
+        r = np.clip(self.partial_corr_many(tests), -1, 1)
+        with np.errstate(divide="ignore"):
+            z = np.sqrt(self.n - sizes - 3) * np.abs(np.arctanh(r))
+        return 2 * norm.sf(z)
+
+    def p_value_bounds(self):
+        """Returns a `PValueBounds` following tests of this test across
+        updates, for `IncrementalPC`.
+        """
+        return PValueBounds(self)
+
+
+class PValueBounds:
+    def __init__(self, test: GaussianIndependenceTest):
+        """Intervals holding the p-values of tests of `test` after updates of
+        its statistics, without recomputing them.
+
+        For the test of i and j given K, let A be the correlation matrix of
+        K + (i, j) and l a lower bound of its smallest eigenvalue. If A
+        changes by E, with e >= ||E|| (its Frobenius norm), the inverse of A
+        changes by at most eps = e / (l (l - e)) in spectral norm, and
+        since the diagonal of the inverse is at least 1, the partial
+        correlation r moves from |r| to within
+        [(|r| - eps) / (1 + eps), (|r| + eps) / (1 - eps)], while the
+        smallest eigenvalue stays above l - e (Weyl). These intervals are
+        widened at every update and reset by `track` when a test is
+        recomputed.
+        """
+        self.test = test
+        self.n = test.n
+        self.corr_matrix = np.array(test.corr_matrix)
+        # For every size of K: the keys of the tests (None once discarded),
+        # their column indices (K, i, j), and the bounds of |r| and of the
+        # smallest eigenvalue of A
+        self.groups = {}
+        # key -> (size of K, row in its group)
+        self.rows = {}
+
+    def _advance(self):
+        if self.test.n == self.n:
+            return
+        diff = self.test.corr_matrix - self.corr_matrix
+        for _, indices, low, high, eigen in self.groups.values():
+            # Rounding errors of the new correlations are covered by 1e-12
+            e = np.sqrt(np.sum(diff[indices[:, :, None], indices[:, None, :]]**2, axis=(1, 2))) + 1e-12
+            with np.errstate(divide="ignore", invalid="ignore"):
+                eps = np.where(eigen > e, e / (eigen * (eigen - e)), np.inf)
+                low[:] = np.where(eps < np.inf, np.maximum((low - eps) / (1 + eps), 0), 0)
+                high[:] = np.where(eps < 1, np.minimum((high + eps) / (1 - eps), 1), 1)
+            eigen -= e
+        self.n = self.test.n
+        self.corr_matrix = np.array(self.test.corr_matrix)
+
+    def track(self, keys: Sequence, tests: Sequence[tuple]):
+        """Computes the partial correlations of the triples (i, j, K) of
+        `tests` on the current statistics, and follows them under `keys`
+        from now on.
+        """
+        self._advance()
+        names = self.test.inv_names
+        by_size = {}
+        for key, (i, j, K) in zip(keys, tests):
+            by_size.setdefault(len(K), ([], []))
+            by_size[len(K)][0].append(key)
+            by_size[len(K)][1].append([names[k] for k in K] + [names[i], names[j]])
+        for size, (group_keys, indices) in by_size.items():
+            indices = np.array(indices, dtype=np.intp).reshape(len(group_keys), size + 2)
+            # Not cached: the p-values of these tests are kept by the caller
+            r = np.abs(np.clip(self.test._partial_corr_indices(indices), -1, 1))
+            eigen = np.linalg.eigvalsh(self.corr_matrix[indices[:, :, None], indices[:, None, :]])[:, 0]
+            if size not in self.groups:
+                self.groups[size] = ([], np.empty((0, size + 2), dtype=np.intp), np.empty(0), np.empty(0), np.empty(0))
+            old_keys, old_indices, low, high, old_eigen = self.groups[size]
+            new = []
+            for row, key in enumerate(group_keys):
+                if key in self.rows:
+                    _, old = self.rows[key]
+                    low[old] = high[old] = r[row]
+                    old_eigen[old] = eigen[row]
+                else:
+                    self.rows[key] = (size, len(old_keys))
+                    old_keys.append(key)
+                    new.append(row)
+            self.groups[size] = (
+                old_keys,
+                np.concatenate([old_indices, indices[new]]),
+                np.concatenate([low, r[new]]),
+                np.concatenate([high, r[new]]),
+                np.concatenate([old_eigen, eigen[new]]))
+
+    def discard(self, keys: Iterable):
+        """Stops following the tests with the given keys."""
+        for key in keys:
+            size, row = self.rows.pop(key)
+            self.groups[size][0][row] = None
+        for size, (group_keys, *arrays) in self.groups.items():
+            alive = [row for row, key in enumerate(group_keys) if key is not None]
+            # Compacted once at least half of the rows are discarded
+            if 2 * len(alive) <= len(group_keys):
+                group_keys = [group_keys[row] for row in alive]
+                self.groups[size] = (group_keys,) + tuple(array[alive] for array in arrays)
+                for row, key in enumerate(group_keys):
+                    self.rows[key] = (size, row)
+
+    def bounds(self) -> tuple[list, np.ndarray, np.ndarray]:
+        """Keys of the followed tests, and lower and upper bounds of their
+        p-values on the current statistics of the test.
+        """
+        self._advance()
+        keys = []
+        low = []
+        high = []
+        for size, (group_keys, _, r_low, r_high, _) in self.groups.items():
+            alive = np.array([key is not None for key in group_keys], dtype=bool)
+            keys += [key for key in group_keys if key is not None]
+            scale = sqrt(self.n - size - 3)
+            with np.errstate(divide="ignore"):
+                low.append(2 * norm.sf(scale * np.arctanh(r_high[alive])))
+                high.append(2 * norm.sf(scale * np.arctanh(r_low[alive])))
+        return keys, np.concatenate(low or [np.empty(0)]), np.concatenate(high or [np.empty(0)])
+
+
+class GaussianBICScore:
+    def __init__(
+            self,
+            data_matrix: np.ndarray,
+            column_names: Sequence[str],
+            penalty_discount: float = 1.0,
+            cache_entries: int = 2**20,
+            cache_bytes: int = None):
+        """Decomposable BIC score of linear Gaussian models, for
+        `ges_algorithm`. The local score of a node i with parents P is
+
+            -n log(var(i | P)) - penalty_discount |P| log(n)
+
+        where var(i | P) is the residual variance of the regression of i
+        on P, computed from the correlation matrix of the same sufficient
+        statistics as `GaussianIndependenceTest` (the scaling of i only
+        adds a constant to the scores of i). Higher is better.
+
+        :param data_matrix: array of shape (n_samples, n_columns)
+        :param column_names: the name of every column
+        :param penalty_discount: weight of the penalty on the number of
+            parents
+        :param cache_entries: maximal number of cached local scores
+        :param cache_bytes: maximal memory used by the cached local scores,
+            see `local_score_cache`
+        """
+        statistics = SufficientStatistics(data_matrix.shape[1])
+        statistics.update(data_matrix)
+        self._init_score(statistics, column_names, penalty_discount, cache_entries, cache_bytes)
+
+    def _init_score(self, statistics, column_names, penalty_discount, cache_entries, cache_bytes):
+        self.statistics = statistics
+        self.n = statistics.n
+        self.corr_matrix = statistics.correlation()
+        self.inv_names = {name: i for i, name in enumerate(column_names)}
+        self.penalty_discount = penalty_discount
+        # Keys are (i, mask) with i the column index of the node and mask
+        # the bitmask of the column indices of its parents
+        self.local_score_cache = BoundedCache(cache_entries, cache_bytes)
+
+    @classmethod
+    def from_statistics(
+            cls,
+            statistics: SufficientStatistics,
+            column_names: Sequence[str],
+            penalty_discount: float = 1.0,
+            cache_entries: int = 2**20,
+            cache_bytes: int = None):
+        """Builds the score from sufficient statistics (or from a
+        `LazyCorrelation`) instead of a data matrix. Other parameters are as
+        in the constructor.
+        """
+        res = cls.__new__(cls)
+        res._init_score(statistics, column_names, penalty_discount, cache_entries, cache_bytes)
+        return res
+
+    @classmethod
+    def from_test(cls, test: GaussianIndependenceTest, **kwargs):
+        """Builds the score on the statistics of an independence test, as
+        they are now. Keyword arguments are passed to the constructor.
+        """
+        column_names = sorted(test.inv_names, key=test.inv_names.get)
+        return cls.from_statistics(test.statistics, column_names, **kwargs)
+
+    def _key(self, i: int, P: Sequence[int]):
+        mask = 0
+        for p in P:
+            mask |= 1 << p
+        return (i, mask)
+
+    def _indices(self, node, parents) -> list:
+        """Column indices of the parents followed by the node."""
+        return [self.inv_names[p] for p in parents] + [self.inv_names[node]]
+
+    def local_score(self, node: str, parents: Iterable[str]) -> float:
+        return self.local_score_many([(node, parents)])[0]
+
+    def _local_score_indices(self, indices: np.ndarray) -> np.ndarray:
+        """Local scores for an integer array of shape (m, k + 1), where each
+        row lists the k parents followed by the node.
+        """
+        k = indices.shape[1] - 1
+        if k == 0:
+            variance = np.ones(indices.shape[0])
+        else:
+            sub = self.corr_matrix[indices[:, :, None], indices[:, None, :]]
+            try:
+                # The last diagonal entry of the Cholesky factor is the
+                # residual standard deviation of the node given its parents
+                variance = np.linalg.cholesky(sub)[:, -1, -1]**2
+            except np.linalg.LinAlgError:
+                # Singular submatrices, regress on the pseudo-inverse
+                c = sub[:, :-1, -1]
+                P = np.linalg.pinv(sub[:, :-1, :-1], hermitian=True)
+                variance = 1 - np.einsum("mi,mij,mj->m", c, P, c)
+        variance = np.maximum(variance, np.finfo(float).tiny)
+        return -self.n * np.log(variance) - self.penalty_discount * k * np.log(self.n)
+
+    def local_score_many(self, families: Sequence[tuple]) -> np.ndarray:
+        """Local scores of a sequence of pairs (node, parents), with one
+        batched Cholesky decomposition per number of parents for the results
+        that are not cached.
+        """
+        res = np.empty(len(families))
+        by_size = {}
+        for t, (node, parents) in enumerate(families):
+            indices = self._indices(node, parents)
+            key = self._key(indices[-1], indices[:-1])
+            cached = self.local_score_cache.get(key)
+            if cached is None:
+                by_size.setdefault(len(indices) - 1, []).append((t, indices, key))
+            else:
+                res[t] = cached
+        for size, to_compute in by_size.items():
+            positions = [t for t, _, _ in to_compute]
+            indices = np.array([idx for _, idx, _ in to_compute], dtype=np.intp).reshape(len(positions), size + 1)
+            res[positions] = self._local_score_indices(indices)
+            for t, _, key in to_compute:
+                self.local_score_cache[key] = res[t]
+        return res
+
+    def missing(self, families: Sequence[tuple]) -> list:
+        """The distinct families (node, parents) whose local score is not
+        cached, without counting cache hits or misses.
+        """
+        res = {}
+        for node, parents in families:
+            indices = self._indices(node, parents)
+            key = self._key(indices[-1], indices[:-1])
+            if key not in self.local_score_cache and key not in res:
+                res[key] = (node, parents)
+        return list(res.values())
+
+    def store(self, families: Sequence[tuple], scores: Sequence[float]):
+        """Caches local scores computed elsewhere, e.g. by worker processes."""
+        for (node, parents), score in zip(families, scores):
+            indices = self._indices(node, parents)
+            self.local_score_cache[self._key(indices[-1], indices[:-1])] = float(score)
@@ -1,40 +1,130 @@
-from itertools import combinations
+from collections import deque, Counter
+from time import perf_counter
 from causality.causal_graph import CausalGraph
 from causality.expression import ProbabilityExpr, SummationExpr, ProductExpr, make_prime, ConjunctionExpr
 
-def no_back_door_path(graph: CausalGraph, X, Y, Z):
+class IdentificationContext:
+    """Memoizes the criteria, the enumerations of adjustment sets and the
+    closed-form derivations of this module. Results are keyed by the graph
+    (its identity and its version, so modifying a graph invalidates them)
+    and by the frozen node sets of the query. Pass the same context to
+    several calls to share the work between them.
+
+    `hits` and `misses` count the cache accesses per function name.
+    """
+    def __init__(self):
+        self._cache = {}
+        # Keeps the graphs alive, so that their id is not reused
+        self._graphs = {}
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _key(self, name, graph, args):
+        self._graphs[id(graph)] = graph
+        return (name, id(graph), graph.version) + tuple(
+            frozenset(a) if isinstance(a, (set, frozenset, list, tuple)) else a
+            for a in args)
+
+    def memoize(self, name, graph, args, compute):
+        """Returns the cached result of `name` on `graph` and `args`, or
+        stores and returns `compute()` if there is none.
+        """
+        key = self._key(name, graph, args)
+        if key in self._cache:
+            self.hits[name] += 1
+        else:
+            self.misses[name] += 1
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def minimal_adjustment_sets(self, graph, X, Y, U, max_sets = None, time_budget = None):
+        """Generates the minimal adjustment sets like
+        `iter_minimal_adjustment_sets`. The enumeration is shared with the
+        previous calls on the same arguments, and only advanced as far as
+        the consumers need.
+        """
+        enumeration = self.memoize(
+            "minimal_adjustment_sets", graph, (X, Y, U),
+            lambda: _CachedEnumeration(iter_minimal_adjustment_sets(graph, X, Y, U)))
+        return enumeration.iterate(max_sets, time_budget)
+
+    def clear(self):
+        self._cache.clear()
+        self._graphs.clear()
+
+
+class _CachedEnumeration:
+    """Lazy list of the items of a generator, that can be iterated several
+    times.
+    """
+    def __init__(self, generator):
+        self.generator = generator
+        self.items = []
+        self.exhausted = False
+
+    def iterate(self, max_items = None, time_budget = None):
+        deadline = None if time_budget is None else perf_counter() + time_budget
+        i = 0
+        while max_items is None or i < max_items:
+            if i == len(self.items):
+                if self.exhausted or (deadline is not None and perf_counter() > deadline):
+                    return
+                try:
+                    self.items.append(next(self.generator))
+                except StopIteration:
+                    self.exhausted = True
+                    return
+            yield self.items[i]
+            i += 1
+
+
+def no_back_door_path(graph: CausalGraph, X, Y, Z, context = None):
     """True if there is no back-door path (confounding) from X to Y given Z."""
+    if context is not None:
+        return context.memoize("no_back_door_path", graph, (X, Y, Z),
+                lambda: no_back_door_path(graph, X, Y, Z))
     return graph.remove_out_of(X).is_d_separated(X, Y, Z)
 
 # "Causality" by Pearl (2009), def 3.3.1, p. 79.
-def back_door_criterion(graph: CausalGraph, X, Y, Z):
+def back_door_criterion(graph: CausalGraph, X, Y, Z, context = None):
+    if context is not None:
+        return context.memoize("back_door_criterion", graph, (X, Y, Z),
+                lambda: back_door_criterion(graph, X, Y, Z))
     return no_back_door_path(graph, X, Y, Z) and graph.descendants(X).isdisjoint(Z)
 
 # Van der Zander, Benito, and Maciej Liśkiewicz. "Finding minimal d-separators
 # in linear time and applications." Uncertainty in Artificial Intelligence.
 # PMLR, 2020.
-# There is probably a better implementation based on the Dijsktra algorithm,
-# but I'm too lazy to write it
 def closure(graph: CausalGraph, X, A, Z):
     """
     Returns all nodes V for which there is a path from X to V that
         * contains only members of A, and
         * has no fork or chain in Z.
     """
-    res = X.copy()
-    for x in X:
-        for a in A.difference(X):
-            for path in graph.all_undirected_paths(x, a):
-                valid_path = True
-                for i, v in enumerate(path[1:-1]):
-                    # If we are outside of A, this path does not work, go to the next one
-                    if v not in A:
-                        valid_path = False
-                    if v in Z and not graph.is_collider(path[i-1], v, path[i + 1]):
-                        valid_path = False
-                if valid_path:
-                    res.add(a)
-                    break
+    # This is a search in the moral graph of A: colliders are always open,
+    # since their parents are married. The path is explored as pairs (node,
+    # direction), where direction is "up" if the node was entered from one
+    # of its children, and "down" if it was entered from one of its parents.
+    # Each pair is visited at most once, so this costs O(V + E).
+    res = set(X)
+    to_visit = deque((p, "up") for p in graph.parents(X) if p in A)
+    to_visit.extend((c, "down") for c in graph.children(X) if c in A)
+    visited = set()
+    while len(to_visit) > 0:
+        node, direction = to_visit.popleft()
+        if (node, direction) in visited:
+            continue
+        visited.add((node, direction))
+        res.add(node)
+
+        # Collider a -> node <- b
+        if direction == "down":
+            to_visit.extend((p, "up") for p in graph.parents({node}) if p in A)
+        # Chain or fork
+        if node not in Z:
+            if direction == "up":
+                to_visit.extend((p, "up") for p in graph.parents({node}) if p in A)
+            to_visit.extend((c, "down") for c in graph.children({node}) if c in A)
     return res
 
 
@@ -54,47 +144,151 @@ def blocking_set(graph: CausalGraph, X, Y, U = set(), always_included = set()):
         return Z_X.intersection(Y_star.union(always_included))
 
 
-# This is exp time, see "Adjustment Criteria in Causal Diagrams: An Algorithmic
-# Perspective" by Johannes Textor and Maciej Liskiewicz for a better
-# algorithm (polynomial per output element).
-def all_minimal_adjustment_sets(graph: CausalGraph, X, Y, U = set()):
-    candidates = set(graph.nodes()).difference(X).difference(Y).difference(U)
-    res = set()
-    for k in range(len(candidates)):
-        for adjustment in combinations(candidates, k):
-            adjustment = frozenset(adjustment)
-            if back_door_criterion(graph, X, Y, adjustment):
-                res.add(adjustment)
-        if len(res) > 0:
-            break
+def _moral_graph(graph: CausalGraph, A):
+    """Returns the moral graph of the subgraph of `graph` induced by A, as
+    a dict mapping every node of A to the set of its neighbors.
+    """
+    res = {v: set() for v in A}
+    for v in A:
+        parents = graph.parents({v}).intersection(A)
+        res[v].update(parents)
+        for p in parents:
+            res[p].add(v)
+            # Marry the parents of v
+            res[p].update(parents)
+            res[p].discard(p)
+    return res
+
+
+def _reach(neighbors, start, blocked):
+    """Nodes reachable from `start` in the undirected graph `neighbors`
+    without entering `blocked`.
+    """
+    res = set(start)
+    stack = list(res)
+    while len(stack) > 0:
+        for w in neighbors[stack.pop()]:
+            if w not in res and w not in blocked:
+                res.add(w)
+                stack.append(w)
     return res
 
+
+# Textor, Johannes, and Maciej Liśkiewicz. "Adjustment criteria in causal
+# diagrams: an algorithmic perspective." UAI 2011; and van der Zander,
+# Liśkiewicz and Textor. "Separators and adjustment sets in causal graphs:
+# complete criteria and an algorithmic framework." Artificial Intelligence,
+# 2019. Minimal adjustment sets are the minimal separators of X and Y in the
+# moral graph of An(X, Y) in the graph without edges out of X, that contain
+# no descendant of X. They are listed with the backtracking of Takata (2010).
+def iter_minimal_adjustment_sets(graph: CausalGraph, X, Y, U = set(), max_sets = None, time_budget = None, context = None):
+    """Generates the minimal back-door adjustment sets for the effect of X
+    on Y that do not contain any member of U, with a polynomial delay
+    between two sets.
+
+    :param max_sets: stop after this many sets
+    :param time_budget: stop after this many seconds
+    :param context: optional `IdentificationContext` sharing the
+        enumeration between calls
+    """
+    if context is not None:
+        yield from context.minimal_adjustment_sets(graph, X, Y, U, max_sets, time_budget)
+        return
+
+    deadline = None if time_budget is None else perf_counter() + time_budget
+    X, Y = set(X), set(Y)
+    graph_X = graph.remove_out_of(X)
+    A = graph_X.ancestors(X.union(Y))
+    neighbors = _moral_graph(graph_X, A)
+    forbidden = A.intersection(set(U).union(graph.descendants(X), Y))
+
+    def close(S, T):
+        """Finds the minimal separator Z closest to S, such that S is on the
+        side of X and T is not. Forbidden nodes of Z are moved to the side
+        of X until Z is allowed. Returns (side of X, Z), or None.
+        """
+        while True:
+            N_S = set().union(*(neighbors[v] for v in S)).difference(S)
+            if not Y.isdisjoint(N_S):
+                return None
+            W = _reach(neighbors, Y, S.union(N_S))
+            Z = {v for v in N_S if not neighbors[v].isdisjoint(W)}
+            C = _reach(neighbors, X, Z)
+            if not T.isdisjoint(C):
+                return None
+            forced = Z.intersection(forbidden)
+            if len(forced) == 0:
+                return C, Z
+            S = C.union(forced)
+
+    n_sets = 0
+    # Every (S, T) on the stack leads to at least one set along its T branch,
+    # so the delay is bounded by the depth times the cost of close
+    to_visit = [(X, Y)]
+    while len(to_visit) > 0:
+        if (max_sets is not None and n_sets >= max_sets) \
+                or (deadline is not None and perf_counter() > deadline):
+            return
+        S, T = to_visit.pop()
+        closed = close(S, T)
+        if closed is None:
+            continue
+        C, Z = closed
+        free = Z.difference(T)
+        if len(free) == 0:
+            n_sets += 1
+            yield frozenset(Z)
+        else:
+            # Either v is on the side of X, or v is not
+            v = next(iter(free))
+            to_visit.append((C, T.union({v})))
+            to_visit.append((C.union({v}), T))
+
+
+def all_minimal_adjustment_sets(graph: CausalGraph, X, Y, U = set(), context = None):
+    """Set of all minimal back-door adjustment sets, see
+    `iter_minimal_adjustment_sets`.
+    """
+    return set(iter_minimal_adjustment_sets(graph, X, Y, U, context=context))
+
 # "Causality" by Pearl (2009), sec. 4.3.3, p.117.
-def closed_form(graph: CausalGraph, X: set, Y: set, U: set = set()):
+def closed_form(graph: CausalGraph, X: set, Y: set, U: set = set(), max_sets = None, time_budget = None, context = None):
     """Find closed-form expressions for the causal effect P(Y | do(X)),
     considering U as latent (can't be adjusted for or conditioned on).
 
     Not every possible expression are returned, since there is an exponential
     number of them (for example, there can be many valid adjustment sets).
+    `max_sets` and `time_budget` limit each enumeration of adjustment sets,
+    see `iter_minimal_adjustment_sets`. Sub-derivations are memoized in
+    `context` (a new `IdentificationContext` if None).
     """
+    if context is None:
+        context = IdentificationContext()
+    return list(context.memoize("closed_form", graph, (X, Y, U, max_sets, time_budget),
+            lambda: _closed_form(graph, X, Y, U, max_sets, time_budget, context)))
+
+
+def _closed_form(graph: CausalGraph, X: set, Y: set, U: set, max_sets, time_budget, context):
+    limits = {"max_sets": max_sets, "time_budget": time_budget, "context": context}
     res = []
     X_expr = ConjunctionExpr(X)
     Y_expr = ConjunctionExpr(Y)
 
     # If there is no causal path from X to Y
-    if graph.remove_into(X).is_d_separated(X, Y, set()):
+    if context.memoize("is_d_separated", graph.remove_into(X), (X, Y, set()),
+            lambda: graph.remove_into(X).is_d_separated(X, Y, set())):
         res.append(ProbabilityExpr(Y_expr))
         return res
 
     # If there is no confounding from X to Y
-    if no_back_door_path(graph, X, Y, set()):
+    if no_back_door_path(graph, X, Y, set(), context):
         res.append(ProbabilityExpr(Y_expr, condition=X_expr))
         return res
 
     # Back-door adjustment
-    for B in all_minimal_adjustment_sets(graph, X, Y, U=U):
+    for B in iter_minimal_adjustment_sets(graph, X, Y, U=U, **limits):
         if len(B) > 0:
-            closed_forms_B = closed_form(graph, X, B)
+            closed_forms_B = closed_form(graph, X, B, **limits)
             for closed_form_B in closed_forms_B:
                 B_expr = ConjunctionExpr(B)
                 B_X_expr = ConjunctionExpr(B.union(X))
@@ -112,10 +306,10 @@ def closed_form(graph: CausalGraph, X: set, Y: set, U: set = set()):
         X_prime_expr = ConjunctionExpr(make_prime(X))
         X_prime_Z_1_expr = ConjunctionExpr(make_prime(X).union(Z_1))
         # If Z_1 is unconfounded
-        if no_back_door_path(graph.remove_into(X), Z_1, Y, set()) \
-                and no_back_door_path(graph, X, Z_1, set()):
+        if no_back_door_path(graph.remove_into(X), Z_1, Y, set(), context) \
+                and no_back_door_path(graph, X, Z_1, set(), context):
             # Front-door adjustment with unconfounded mediator Z_1
-            res.append(Summation(
+            res.append(SummationExpr(
                 Z_1_expr,
                 ProductExpr([
                     ProbabilityExpr(Z_1_expr, condition=X_expr),
@@ -132,8 +326,8 @@ def closed_form(graph: CausalGraph, X: set, Y: set, U: set = set()):
         else:
             # Generalized front-door where we adjust for confounding with the mediator Z_1
             Z_2_already_used = set()
-            for Z_3 in all_minimal_adjustment_sets(graph, X, Z_1, U=U):
-                for Z_4 in all_minimal_adjustment_sets(graph.remove_into(X), Z_1, Y, U=U):
+            for Z_3 in iter_minimal_adjustment_sets(graph, X, Z_1, U=U, **limits):
+                for Z_4 in iter_minimal_adjustment_sets(graph.remove_into(X), Z_1, Y, U=U, **limits):
                     Z_2 = Z_3.union(Z_4)
                     if X.isdisjoint(Z_2) and Z_2 not in Z_2_already_used:
                         Z_2_expr = ConjunctionExpr(Z_2)
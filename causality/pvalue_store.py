@@ -0,0 +1,159 @@
+from typing import Sequence
+from hashlib import sha1
+from threading import Lock
+import sqlite3
+import numpy as np
+from causality.gaussian import iter_chunks
+
+
+def fingerprint(data, chunk_size: int = 100000) -> str:
+    """Hash of the shape, type and values of a data matrix (an array,
+    memory-mapped array or `.npy` path), identifying the data set in a
+    `PValueStore`.
+    """
+    if isinstance(data, str):
+        data = np.load(data, mmap_mode="r")
+    digest = sha1(str((data.shape, data.dtype.str)).encode())
+    for chunk in iter_chunks(data, chunk_size):
+        digest.update(np.ascontiguousarray(chunk).tobytes())
+    return digest.hexdigest()
+
+
+class PValueStore:
+    def __init__(self, path: str = None, fingerprint: str = "", commit_every: int = 10000):
+        """p-values of independence tests (x, y, Z), which do not depend on
+        the significance level and can be reused across runs.
+
+        :param path: SQLite file where the p-values are kept, or None to
+            only keep them in memory. The p-values already in the file for
+            `fingerprint` are loaded, and new ones are written through.
+        :param fingerprint: identifies the data set (and test) the p-values
+            were computed on, see `fingerprint`. A file can hold the p-values
+            of several data sets.
+        :param commit_every: number of new p-values buffered before they
+            are written to the file in one transaction. The buffer is also
+            written by `flush` (after every level of `pc_algorithm`) and
+            `close`.
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.commit_every = commit_every
+        self._values = {}
+        self._pending = []
+        self._lock = Lock()
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS pvalues ("
+                "fingerprint TEXT, x TEXT, y TEXT, z TEXT, pvalue REAL, "
+                "PRIMARY KEY (fingerprint, x, y, z))")
+            rows = self._connection.execute(
+                "SELECT x, y, z, pvalue FROM pvalues WHERE fingerprint = ?", (fingerprint,))
+            for x, y, z, p in rows:
+                self._values[(x, y, z)] = p
+
+    @staticmethod
+    def key(x: str, y: str, Z: Sequence[str]) -> tuple[str, str, str]:
+        """The test of x and y given Z is the test of y and x given Z, with
+        Z in any order. Variable names must not contain the unit separator
+        character.
+        """
+        x, y = sorted((str(x), str(y)))
+        return x, y, "\x1f".join(sorted(str(z) for z in Z))
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, x: str, y: str, Z: Sequence[str]) -> float:
+        """Stored p-value of the test, or None."""
+        return self._values.get(self.key(x, y, Z))
+
+    def put_many(self, tests: Sequence[tuple], p_values: Sequence[float]):
+        """Stores the p-values of a sequence of triples (x, y, Z)."""
+        rows = [self.key(x, y, Z) + (float(p),) for (x, y, Z), p in zip(tests, p_values)]
+        with self._lock:
+            for x, y, z, p in rows:
+                self._values[(x, y, z)] = p
+            if self._connection is not None:
+                self._pending += rows
+                if len(self._pending) >= self.commit_every:
+                    self._write_pending()
+
+    def _write_pending(self):
+        if len(self._pending) > 0:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO pvalues VALUES (?, ?, ?, ?, ?)",
+                [(self.fingerprint,) + row for row in self._pending])
+            self._connection.commit()
+            self._pending = []
+
+    def flush(self):
+        """Writes the buffered p-values to the file."""
+        with self._lock:
+            if self._connection is not None:
+                self._write_pending()
+
+    def close(self):
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CachedIndependenceTest:
+    def __init__(self, indep_test, store: PValueStore = None):
+        """Wraps an independence test (such as `GaussianIndependenceTest`)
+        so that each p-value is computed once and kept in `store`, a
+        `PValueStore` in memory by default. Keyword arguments of the tests
+        are not part of the keys, so they must not change for a store.
+
+        The counters `hits` and `misses` give the number of p-values read
+        from the store and computed. The store is shared by threads, so use
+        the "thread" backend of `pc_algorithm`.
+        """
+        self.indep_test_object = indep_test
+        self.store = PValueStore() if store is None else store
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch(self, column_groups):
+        if hasattr(self.indep_test_object, "prefetch"):
+            self.indep_test_object.prefetch(column_groups)
+
+    def flush(self):
+        self.store.flush()
+
+    def indep_test(self, x: str, y: str, Z: Sequence[str], **kwargs) -> float:
+        return self.indep_test_many([(x, y, Z)], **kwargs)[0]
+
+    def indep_test_many(self, tests: Sequence[tuple], **kwargs) -> np.ndarray:
+        """p-values of a sequence of triples (x, y, Z). The ones missing
+        from the store are computed in one batch if the wrapped test has a
+        method `indep_test_many`.
+        """
+        res = np.empty(len(tests))
+        missing = []
+        for t, (x, y, Z) in enumerate(tests):
+            p = self.store.get(x, y, Z)
+            if p is None:
+                missing.append(t)
+            else:
+                res[t] = p
+        self.hits += len(tests) - len(missing)
+        self.misses += len(missing)
+        if len(missing) > 0:
+            to_compute = [tests[t] for t in missing]
+            if hasattr(self.indep_test_object, "indep_test_many"):
+                p_values = self.indep_test_object.indep_test_many(to_compute, **kwargs)
+            else:
+                p_values = [self.indep_test_object.indep_test(x, y, Z, **kwargs) for x, y, Z in to_compute]
+            res[missing] = p_values
+            self.store.put_many(to_compute, p_values)
+        return res
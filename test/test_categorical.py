@@ -0,0 +1,79 @@
+import unittest
+from itertools import combinations
+import numpy as np
+from scipy.stats import chi2, chi2_contingency
+from causality.categorical import CategoricalIndependenceTest
+
+
+class TestCategorical(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 2000
+        # Chain V0 -> V1 -> V2, V3 independent of the others
+        v0 = rng.integers(0, 3, n)
+        v1 = np.where(rng.random(n) < 0.8, v0 % 2, rng.integers(0, 2, n))
+        v2 = np.where(rng.random(n) < 0.8, v1, rng.integers(0, 2, n))
+        v3 = rng.integers(0, 4, n)
+        self.data = np.column_stack([v0, v1, v2, v3])
+        self.names = ["V0", "V1", "V2", "V3"]
+
+    def test_unconditional_matches_scipy(self):
+        for method, lambda_ in [("chi2", None), ("g", "log-likelihood")]:
+            test = CategoricalIndependenceTest(self.data, self.names, method=method)
+            for i, j in combinations(range(4), 2):
+                table = np.histogram2d(self.data[:, i], self.data[:, j],
+                                       bins=[np.arange(5) - 0.5, np.arange(5) - 0.5])[0]
+                table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+                expected = chi2_contingency(table, correction=False, lambda_=lambda_)
+                stat, dof = test.statistic(i, j, ())
+                self.assertAlmostEqual(stat, expected[0])
+                self.assertEqual(dof, expected[2])
+                self.assertAlmostEqual(test.indep_test(self.names[i], self.names[j], []), expected[1])
+
+    def test_conditional(self):
+        for method in ("chi2", "g"):
+            test = CategoricalIndependenceTest(self.data, self.names, method=method)
+            self.assertLess(test.indep_test("V0", "V2", []), 0.01)
+            self.assertGreater(test.indep_test("V0", "V2", ["V1"]), 0.01)
+            self.assertLess(test.indep_test("V1", "V2", ["V0", "V3"]), 0.01)
+
+            tests = []
+            for i, j in combinations(self.names, 2):
+                others = [k for k in self.names if k not in (i, j)]
+                for size in range(3):
+                    tests += [(i, j, K) for K in combinations(others, size)]
+            np.testing.assert_allclose(test.indep_test_many(tests), [test.indep_test(*t) for t in tests])
+
+        # Constant columns have no degree of freedom
+        constant = np.column_stack([self.data[:, 0], np.zeros(len(self.data))])
+        test = CategoricalIndependenceTest(constant, ["V0", "C"])
+        self.assertEqual(test.indep_test("V0", "C", []), 1.0)
+
+    def test_batched_matches_strata(self):
+        # Sums of the statistics and degrees of freedom of scipy over the
+        # strata of K, with the tables counted together or one by one
+        tests = [(i, j, K) for i, j in combinations(range(4), 2)
+                 for K in [(), tuple(k for k in range(4) if k not in (i, j))[:1]]]
+        for method, lambda_ in [("chi2", None), ("g", "log-likelihood")]:
+            expected = []
+            for i, j, K in tests:
+                stat, dof = 0, 0
+                strata = [np.ones(len(self.data), dtype=bool)] if len(K) == 0 \
+                    else [self.data[:, K[0]] == value for value in np.unique(self.data[:, K[0]])]
+                for rows in strata:
+                    table = np.histogram2d(self.data[rows, i], self.data[rows, j],
+                                           bins=[np.arange(5) - 0.5, np.arange(5) - 0.5])[0]
+                    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+                    if min(table.shape) > 1:
+                        res = chi2_contingency(table, correction=False, lambda_=lambda_)
+                        stat += res[0]
+                        dof += res[2]
+                expected.append(chi2.sf(stat, dof) if dof > 0 else 1.0)
+            named = [(self.names[i], self.names[j], [self.names[k] for k in K]) for i, j, K in tests]
+            for max_cells in [2**18, 1]:
+                test = CategoricalIndependenceTest(self.data, self.names, method=method, max_cells=max_cells)
+                np.testing.assert_allclose(test.indep_test_many(named), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+from itertools import product
+from math import prod
+from random import Random
+from scipy import stats
+from causality import Variable, DiscreteFunction, Xor, And, Or, Not, IndependentDistribution, CausalModel
+from causality.expression import ConjunctionExpr, EqualityExpr
+from causality.contraction import ContractionPlan
+
+
+def random_model(n_exogenous, n_endogenous, seed):
+    rng = Random(seed)
+    exogenous = [Variable("U" + str(i), (False, True)) for i in range(n_exogenous)]
+    variables = list(exogenous)
+    functions = {}
+    for i in range(n_endogenous):
+        var = Variable("V" + str(i), (False, True))
+        inputs = rng.sample(variables, rng.randint(1, 3))
+        functions[var] = rng.choice([Xor, And, Or])(inputs, var)
+        variables.append(var)
+    P = IndependentDistribution({u: stats.bernoulli(rng.uniform(0.1, 0.9)) for u in exogenous})
+    return CausalModel(P, functions), variables
+
+
+def brute_force_probability(model, expression):
+    """Sums the probability of every valuation of the exogenous variables
+    for which the expression holds.
+    """
+    values = expression.values()
+    interventions = list(dict.fromkeys(v.intervention for v in values.dimensions if v.intervention is not None))
+    compiled = model.compile(interventions)
+    exogenous = list(model.exo_dist.dists)
+    res = 0
+    for assignment in product(*(u.support for u in exogenous)):
+        valuation = dict(zip(exogenous, assignment))
+        for var in compiled.sorted_endogenous:
+            F = compiled.functions[var]
+            valuation[var] = F.function(*[valuation[pa] for pa in F.inputs])
+        if values.values[tuple(dim.support.index(valuation[dim]) for dim in values.dimensions)]:
+            res += prod(model.exo_dist.dists[u].pmf(valuation[u]) for u in exogenous)
+    return res
+
+
+class TestCausalModel(unittest.TestCase):
+    def setUp(self):
+        self.X = Variable("X", (False, True))
+        self.Y = Variable("Y", (False, True))
+        self.U = Variable("U", (False, True))
+        self.Z = Variable("Z", (False, True))
+        self.W = Variable("W", (False, True))
+        P = IndependentDistribution({
+            self.X: stats.bernoulli(0.2),
+            self.Y: stats.bernoulli(0.4),
+            self.U: stats.bernoulli(0.7)
+        })
+        self.model = CausalModel(P, {
+            self.Z: Xor((self.X, self.Y), self.Z),
+            self.W: And((self.Z, self.U), self.W)
+        })
+
+    def test_probability(self):
+        self.assertAlmostEqual(self.model.probability(EqualityExpr(self.Z, True)), 0.44)
+        self.assertAlmostEqual(self.model.probability(EqualityExpr(self.W, True)), 0.44 * 0.7)
+        self.assertAlmostEqual(self.model.probability(EqualityExpr(self.Z.do(self.X, False), self.Y)), 1)
+        # W_{X = True} = not Y and U, with X xor Y
+        expression = ConjunctionExpr([EqualityExpr(self.W.do(self.X, True), True), EqualityExpr(self.Z, True)])
+        self.assertAlmostEqual(self.model.probability(expression), 0.2 * 0.6 * 0.7)
+
+    def test_compiled_models(self):
+        functions = dict(self.model.functions)
+        expression = EqualityExpr(self.W.do(self.X, True), True)
+        p = self.model.probability(expression)
+        self.assertEqual(self.model.probability(expression), p)
+        # The twin network is built once, without modifying the model
+        self.assertEqual(len(self.model.compiled_models), 1)
+        self.assertEqual(self.model.compiled_models.hits, 1)
+        self.assertEqual(self.model.functions, functions)
+        compiled = self.model.compile([(self.X, True)])
+        self.assertIs(compiled.functions[self.Z], self.model.functions[self.Z])
+        with self.assertRaises(TypeError):
+            compiled.functions[self.Z] = None
+
+        self.model.intervention(self.X, True)
+        self.assertEqual(len(self.model.compiled_models), 0)
+        self.assertAlmostEqual(self.model.probability(EqualityExpr(self.W, True)), 0.6 * 0.7)
+
+    def test_contraction_plans(self):
+        for seed in range(5):
+            model, variables = random_model(6, 10, seed)
+            rng = Random(seed)
+            endogenous = variables[6:]
+            for _ in range(5):
+                queried = rng.sample(endogenous, 3)
+                expression = ConjunctionExpr([EqualityExpr(queried[0], True), EqualityExpr(queried[1], queried[2])])
+                expected = brute_force_probability(model, expression)
+                for heuristic in ["min_fill", "greedy"]:
+                    self.assertAlmostEqual(model.probability(expression, heuristic=heuristic), expected)
+                # Counterfactual query, on an intervention on an ancestor
+                ancestors = [v for v in endogenous if v in model.graph.ancestors({queried[0]}) and v != queried[0]]
+                if len(ancestors) > 0:
+                    expression = EqualityExpr(queried[0].do(ancestors[0], True), queried[2])
+                    self.assertAlmostEqual(model.probability(expression), brute_force_probability(model, expression))
+
+        expression = EqualityExpr(self.W, True)
+        plan = self.model.plan(expression)
+        self.assertEqual(set(plan.order), {self.Z, self.W})
+        self.assertEqual(set(plan.dimensions), {self.X, self.Y, self.U})
+        self.assertEqual(plan.peak_size, 8)
+        with self.assertRaises(ValueError):
+            self.model.probability(expression, max_size=4)
+
+        # Every step is one einsum call, with at most 52 variables
+        constant = [Variable("C" + str(i), (True,)) for i in range(60)]
+        plan = ContractionPlan([(self.X, c) for c in constant[:51]], [self.X])
+        self.assertEqual(set(plan.dimensions), set(constant[:51]))
+        with self.assertRaises(ValueError):
+            ContractionPlan([(self.X, c) for c in constant], [self.X])
+
+    def test_relevance_pruning(self):
+        calls = []
+        def f(z, u):
+            calls.append((z, u))
+            return z and u
+        self.model.functions[self.W] = DiscreteFunction(f, (self.Z, self.U), self.W)
+        self.model = CausalModel(self.model.exo_dist, self.model.functions)
+        n_calls = len(calls)
+
+        # W and U are not ancestors of Z, and the twin of W is not built
+        expression = EqualityExpr(self.Z.do(self.X, True), True)
+        self.assertAlmostEqual(self.model.probability(expression), 0.6)
+        plan = self.model.plan(expression)
+        self.assertEqual(set(plan.order), {self.Z.do(self.X, True), self.X.do(self.X, True)})
+        self.assertEqual(set(plan.dimensions), {self.Y})
+        self.assertEqual(len(calls), n_calls)
+
+        self.assertAlmostEqual(self.model.probability(EqualityExpr(self.W.do(self.X, True), True)), 0.6 * 0.7)
+        self.assertGreater(len(calls), n_calls)
+
+    def test_preimages(self):
+        model, variables = random_model(4, 6, 0)
+        # Sampling does not need the preimages
+        samples = model.rvs(100)
+        self.assertEqual(set(samples), set(variables))
+        self.assertTrue(all(F._preimage is None for F in model.functions.values()))
+
+        B = (False, True)
+        inputs = (Variable("A", B), Variable("B", B), Variable("C", (0, 1, 2)))
+        output = Variable("D", (0, 1, 2, 3, 4))
+        functions = [
+            DiscreteFunction(lambda a, b, c: a + b + c, inputs, output),
+            # Fails on arrays
+            DiscreteFunction(lambda a, b, c: c if a else b, inputs, output),
+            Xor(inputs[:2], Variable("E", B)),
+            Not(inputs[0], Variable("E", B))
+        ]
+        for F in functions:
+            self.assertTrue((F.preimage.values == F._compute_preimage_by_cells()).all())
+
+        # The twin copies share the preimage of the original function
+        expression = EqualityExpr(self.W.do(self.X, True), True)
+        self.model.probability(expression)
+        compiled = self.model.compile([(self.X, True)])
+        self.assertIs(compiled.functions[self.W.do(self.X, True)].preimage.values,
+                      self.model.functions[self.W].preimage.values)
+        self.assertIs(Xor((self.X, self.Y), self.Z).preimage.values, self.model.functions[self.Z].preimage.values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,42 @@
 import unittest
+from random import Random
+from itertools import combinations
 from causality import CausalGraph
+from causality.d_separation import DSeparationOracle
+from causality.discovery import pc_algorithm
+
+
+def d_separated_by_paths(graph, X, Y, Z):
+    """Reference implementation enumerating every undirected path."""
+    for x in X:
+        for y in Y:
+            for path in graph.all_undirected_paths(x, y):
+                path_blocked = False
+                for i in range(1, len(path) - 1):
+                    a, b, c = path[i - 1:i + 2]
+                    if graph.is_collider(a, b, c):
+                        if graph.descendants({b}).isdisjoint(Z):
+                            path_blocked = True
+                            break
+                    elif b in Z:
+                        path_blocked = True
+                        break
+                if not path_blocked:
+                    return False
+    return True
+
+
+def random_dag(n_nodes, n_edges, seed):
+    rng = Random(seed)
+    nodes = ["V" + str(i) for i in range(n_nodes)]
+    edges = list(combinations(nodes, 2))
+    rng.shuffle(edges)
+    graph = CausalGraph()
+    for node in nodes:
+        graph.add_node(node)
+    for begin, end in edges[:n_edges]:
+        graph.add_edge(begin, end)
+    return graph, rng
 
 class TestGraphHelpers(unittest.TestCase):
     def setUp(self):
@@ -11,6 +48,71 @@ class TestGraphHelpers(unittest.TestCase):
         self.g.add_edge("X", "Z")
         self.g.add_edge("W", "Y")
 
+    def test_adjacency_index(self):
+        self.g.add_edge("W", "X")
+        self.assertEqual(self.g.children({"W"}), {"X", "Y"})
+        self.assertEqual(self.g.parents({"X", "Y"}), {"W"})
+        self.assertEqual(self.g.ancestors({"Z"}), {"Z", "X", "W"})
+        self.g.del_edge("W", "Y")
+        self.g.del_node("X")
+        self.g.add_edge("Z", "V")
+        self.assertEqual(self.g.children({"W"}), set())
+        self.assertEqual(self.g.parents({"Z"}), set())
+        self.assertEqual(self.g.descendants({"Z"}), {"Z", "V"})
+
+    def test_closure_index(self):
+        rng = Random(0)
+        indexed = CausalGraph(closure_index=True)
+        reference = CausalGraph()
+        nodes = ["V" + str(i) for i in range(8)]
+        for step in range(300):
+            x, y = rng.sample(nodes, 2)
+            action = rng.random()
+            for graph in (indexed, reference):
+                if action < 0.6:
+                    graph.add_edge(x, y)
+                elif action < 0.95:
+                    graph.del_edge(x, y)
+                else:
+                    graph.del_node(x)
+            for node in reference.nodes():
+                self.assertEqual(indexed.ancestors({node}), reference.ancestors({node}))
+                self.assertEqual(indexed.descendants({node}), reference.descendants({node}))
+
+    def test_mutilated_views(self):
+        for seed in range(10):
+            graph, rng = random_dag(8, 12, seed)
+            nodes = graph.nodes()
+            X = set(rng.sample(nodes, 2))
+            for into_X, view in [(True, graph.remove_into(X)), (False, graph.remove_out_of(X))]:
+                expected = graph.copy()
+                for x in X:
+                    for edge in graph.edges(to_node=x) if into_X else graph.edges(from_node=x):
+                        expected.del_edge(edge[0], edge[1])
+                self.assertEqual(sorted(view.edges()), sorted(expected.edges()))
+                for node in nodes:
+                    self.assertEqual(view.parents({node}), expected.parents({node}))
+                    self.assertEqual(view.descendants({node}), expected.descendants({node}))
+                x, y = rng.sample(nodes, 2)
+                self.assertEqual(view.is_d_separated({x}, {y}, X), expected.is_d_separated({x}, {y}, X))
+                self.assertEqual(view.copy(), expected)
+                # Queries inherited from graph.Graph
+                self.assertEqual(view, expected)
+                self.assertEqual(expected, view)
+                self.assertEqual(sorted(view.all_simple_paths(x, y)), sorted(expected.all_simple_paths(x, y)))
+                self.assertEqual(view.shortest_path(x, y)[0], expected.shortest_path(x, y)[0])
+                self.assertEqual(len(view.breadth_first_search(x, y)), len(expected.breadth_first_search(x, y)))
+                self.assertEqual(view.is_connected(x, y), expected.is_connected(x, y))
+                order = {node: i for i, node in enumerate(view.topological_sort())}
+                self.assertTrue(all(order[a] < order[b] for a, b, _ in expected.edges()))
+                self.assertEqual(sorted(map(sorted, view.components())), sorted(map(sorted, expected.components())))
+                self.assertEqual(sorted(view.to_list()), sorted(expected.to_list()))
+        self.assertIs(graph.remove_into(X), graph.remove_into(X))
+        with self.assertRaises(TypeError):
+            graph.remove_into(X).add_edge("V0", "V1")
+        with self.assertRaises(TypeError):
+            graph.remove_into(X).from_list([("V0", "V1", 1)])
+
     def test_is_d_separated(self):
         # Current graph: X -> Z; W -> Y
         for a, other_a in [("Z", "X"), ("X", "Z")]:
@@ -44,6 +146,64 @@ class TestGraphHelpers(unittest.TestCase):
         self.assertFalse(self.g.is_d_separated({"Y"}, {"X"}, {"Z"}))
         self.assertFalse(self.g.is_d_separated({"W"}, {"Y"}, {"Z"}))
 
+    def test_matches_path_enumeration(self):
+        for seed in range(20):
+            graph, rng = random_dag(7, 10, seed)
+            nodes = graph.nodes()
+            for _ in range(30):
+                x, y = rng.sample(nodes, 2)
+                Z = set(rng.sample([n for n in nodes if n not in (x, y)], rng.randint(0, 3)))
+                self.assertEqual(
+                    graph.is_d_separated({x}, {y}, Z),
+                    d_separated_by_paths(graph, {x}, {y}, Z)
+                )
+
+    def test_d_separation_batch(self):
+        graph, rng = random_dag(30, 60, 0)
+        nodes = graph.nodes()
+        queries = []
+        for _ in range(200):
+            x, y = rng.sample(nodes, 2)
+            Z = set(rng.sample([n for n in nodes if n not in (x, y)], rng.randint(0, 5)))
+            queries.append(({x}, {y}, Z))
+        expected = [graph.is_d_separated(*query) for query in queries]
+        self.assertEqual(graph.d_separation_batch(queries).tolist(), expected)
+        self.assertEqual(graph.d_separation_batch(queries, processes=2).tolist(), expected)
+
+    def test_oracle(self):
+        graph, _ = random_dag(15, 25, 1)
+        oracle = DSeparationOracle(graph)
+        rng = Random(0)
+        nodes = graph.nodes()
+        for x, y in combinations(nodes, 2):
+            Z = rng.sample([z for z in nodes if z not in (x, y)], rng.randint(0, 3))
+            expected = 1.0 if graph.is_d_separated({x}, {y}, set(Z)) else 0.0
+            self.assertEqual(oracle.indep_test(x, y, Z), expected)
+            self.assertEqual(oracle.indep_test(y, x, Z), expected)
+
+        initial_graph = CausalGraph()
+        for node in graph.nodes():
+            initial_graph.add_node(node)
+        res = pc_algorithm(None, oracle, 0.5, initial_graph=initial_graph.complete().copy(), stable=True)
+        # With a perfect test, PC finds the skeleton of the graph and only
+        # orients edges as in the graph
+        dag_edges = {(begin, end) for begin, end, _ in graph.edges()}
+        self.assertEqual({frozenset((b, e)) for b, e, _ in res.edges()}, {frozenset(edge) for edge in dag_edges})
+        self.assertLessEqual({(b, e) for b, e, _ in res.edges() if res.edge(e, b) is None}, dag_edges)
+
+        # One pass answers the tests of x against several y
+        self.assertLess(oracle.cache.misses, sum(oracle.query_sizes.values()))
+        self.assertGreater(oracle.query_sizes[1], 0)
+        misses = oracle.cache.misses
+        pc_algorithm(None, oracle, 0.5, initial_graph=initial_graph.complete().copy(), stable=True)
+        self.assertEqual(oracle.cache.misses, misses)
+
+    def test_cycles(self):
+        self.g.add_edge("Z", "W")
+        self.g.add_edge("W", "X")
+        with self.assertRaises(RuntimeError):
+            self.g.is_d_separated({"X"}, {"Y"}, set())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,181 @@
+import unittest
+import random
+import numpy as np
+from itertools import combinations, permutations
+from causality import CausalGraph
+from causality.random_system import generate_linear_system, sample_linear_system
+from causality.gaussian import GaussianIndependenceTest, GaussianBICScore
+from causality.discovery import pc_algorithm, orient_colliders, orient_edges, IncrementalPC, \
+    ges_algorithm, pdag_to_cpdag
+from causality.pvalue_store import CachedIndependenceTest
+
+
+def skeleton(graph):
+    return {frozenset((begin, end)) for begin, end, _ in graph.edges()}
+
+
+def oriented(graph):
+    return {(begin, end) for begin, end, _ in graph.edges() if graph.edge(end, begin) is None}
+
+
+def meek_full_passes(graph):
+    """Applies the rules R1 to R4 to all pairs of nodes until a pass
+    orients no edge.
+    """
+    def directed(x, y):
+        return graph.is_adjacent(x, y) and graph.edge(y, x) is None
+
+    nodes = graph.nodes()
+    changed = True
+    while changed:
+        changed = False
+        for x, y in permutations(nodes, 2):
+            if not graph.is_undirected(x, y):
+                continue
+            others = [z for z in nodes if z not in (x, y)]
+            r1 = any(directed(z, x) and not graph.is_adjacent(z, y) for z in others)
+            r2 = any(directed(x, z) and directed(z, y) for z in others)
+            r3 = any(graph.is_undirected(x, z) and graph.is_undirected(x, w) and directed(z, y)
+                     and directed(w, y) and not graph.is_adjacent(z, w) for z, w in combinations(others, 2))
+            r4 = any(graph.is_undirected(x, w) and directed(w, z) and directed(z, y)
+                     and graph.is_adjacent(x, z) and not graph.is_adjacent(w, y)
+                     for z, w in permutations(others, 2))
+            if r1 or r2 or r3 or r4:
+                graph.del_edge(y, x)
+                changed = True
+
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.graph = generate_linear_system(
+            n_nodes=8, n_edges=10,
+            min_mu=0, max_mu=0,
+            min_sigma=0.5, max_sigma=1,
+            min_rho=0.5, max_rho=1
+        )
+        self.data = sample_linear_system(self.graph, 2000)
+        self.test = GaussianIndependenceTest(self.data, self.graph.nodes())
+
+    def run_pc(self, nodes, **kwargs):
+        initial_graph = CausalGraph()
+        for node in nodes:
+            initial_graph.add_node(node)
+        return pc_algorithm(self.data, self.test, 0.05, initial_graph=initial_graph.complete().copy(), **kwargs)
+
+    def test_stable_pc(self):
+        nodes = self.graph.nodes()
+        expected = skeleton(self.run_pc(nodes, stable=True))
+        # The skeleton of stable PC does not depend on the order of nodes
+        for seed in range(3):
+            shuffled = list(nodes)
+            random.Random(seed).shuffle(shuffled)
+            self.assertEqual(skeleton(self.run_pc(shuffled, stable=True)), expected)
+        # Parallel tests give the same graph
+        res = self.run_pc(nodes, stable=True)
+        for backend in ["thread", "process"]:
+            parallel = self.run_pc(nodes, stable=True, n_jobs=2, backend=backend)
+            self.assertEqual(sorted(parallel.edges()), sorted(res.edges()))
+        with self.assertRaises(ValueError):
+            self.run_pc(nodes, n_jobs=2)
+
+    def test_orientation_fixpoint(self):
+        for seed in range(20):
+            rng = random.Random(seed)
+            nodes = ["V" + str(i) for i in range(9)]
+            pairs = list(combinations(nodes, 2))
+            rng.shuffle(pairs)
+            dag = CausalGraph()
+            for node in nodes:
+                dag.add_node(node)
+            for begin, end in pairs[:14]:
+                dag.add_edge(begin, end)
+
+            # Skeleton of the DAG, and separating sets of its non-adjacent
+            # pairs (the parents of one of the nodes)
+            skeleton_graph = dag.copy()
+            for begin, end in pairs[:14]:
+                skeleton_graph.add_edge(end, begin)
+            sep_set = {}
+            for x, y in pairs[14:]:
+                Z = dag.parents({x})
+                if not dag.is_d_separated({x}, {y}, Z):
+                    Z = dag.parents({y})
+                sep_set[(x, y)] = sep_set[(y, x)] = Z
+
+            worklist = skeleton_graph.copy()
+            orient_edges(worklist, sep_set)
+            full_passes = skeleton_graph.copy()
+            orient_colliders(full_passes, sep_set)
+            meek_full_passes(full_passes)
+            self.assertEqual(sorted(worklist.edges()), sorted(full_passes.edges()))
+            # The oriented edges are those of the DAG
+            self.assertEqual(skeleton(worklist), skeleton(dag))
+            self.assertLessEqual(oriented(worklist), {(begin, end) for begin, end, _ in dag.edges()})
+
+    def test_incremental_pc(self):
+        nodes = self.graph.nodes()
+        batches = [self.data[:1000]] + [self.data[k:k + 100] for k in range(1000, 1600, 100)]
+        incremental = IncrementalPC(GaussianIndependenceTest(batches[0], nodes), 0.05, nodes)
+        replayed = []
+        for k in range(1, len(batches)):
+            replayed.append(incremental.update(batches[k]))
+            data = np.concatenate(batches[:k + 1])
+            initial_graph = CausalGraph()
+            for node in nodes:
+                initial_graph.add_node(node)
+            cold_test = CachedIndependenceTest(GaussianIndependenceTest(data, nodes))
+            expected = pc_algorithm(data, cold_test, 0.05, initial_graph=initial_graph.complete(), stable=True)
+            self.assertEqual(sorted(incremental.graph.edges()), sorted(expected.edges()))
+            # Only the tests whose decision may have changed, and the new
+            # ones, are computed
+            self.assertLess(incremental.computed, cold_test.misses)
+            self.assertEqual(set(incremental.margins()), {frozenset(pair) for pair in combinations(nodes, 2)})
+        # Both the updates keeping all the decisions and the replays
+        self.assertEqual(set(replayed), {False, True})
+
+    def test_bic_score(self):
+        score = GaussianBICScore.from_test(self.test)
+        nodes = self.graph.nodes()
+        x = (self.data - self.data.mean(axis=0)) / self.data.std(axis=0)
+        families = [(nodes[0], []), (nodes[1], [nodes[2]]), (nodes[3], [nodes[4], nodes[5], nodes[6]])]
+        for (node, parents), res in zip(families, score.local_score_many(families)):
+            i = nodes.index(node)
+            P = [nodes.index(p) for p in parents]
+            residuals = x[:, i] - x[:, P] @ np.linalg.lstsq(x[:, P], x[:, i], rcond=None)[0]
+            expected = -len(x) * np.log(residuals.var()) - len(P) * np.log(len(x))
+            self.assertAlmostEqual(res, expected, places=6)
+            # The order of the parents does not matter
+            self.assertEqual(score.local_score(node, reversed(parents)), res)
+        self.assertEqual(score.missing(families), [])
+
+    def test_ges(self):
+        np.random.seed(0)
+        data = sample_linear_system(self.graph, 10000)
+        nodes = self.graph.nodes()
+
+        def run_ges(**kwargs):
+            initial_graph = CausalGraph()
+            for node in nodes:
+                initial_graph.add_node(node)
+            return ges_algorithm(data, GaussianBICScore(data, nodes), initial_graph=initial_graph, **kwargs)
+
+        res = run_ges()
+        expected = pdag_to_cpdag(self.graph)
+        self.assertEqual(skeleton(res), skeleton(expected))
+        self.assertEqual(oriented(res), oriented(expected))
+        for backend in ["thread", "process"]:
+            parallel = run_ges(n_jobs=2, backend=backend)
+            self.assertEqual(sorted(parallel.edges()), sorted(res.edges()))
+
+    def test_pdag_to_cpdag(self):
+        # x -> z <- y is kept, z -> w is then forced by R1, u - x stays
+        dag = CausalGraph(from_list=[("x", "z"), ("y", "z"), ("z", "w"), ("u", "x")])
+        res = pdag_to_cpdag(dag)
+        self.assertEqual(oriented(res), {("x", "z"), ("y", "z"), ("z", "w")})
+        self.assertTrue(res.is_undirected("u", "x"))
+        self.assertEqual(sorted(pdag_to_cpdag(res).edges()), sorted(res.edges()))
+
+
+if __name__ == '__main__':
+    unittest.main()
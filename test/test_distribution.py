@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+from scipy import stats
+from causality import Variable, DiscreteSet, IndependentDistribution
+
+
+def pmf_by_cells(dist, set_):
+    """Sums the probability of every cell of the set, one at a time."""
+    res = 0
+    for index in zip(*np.nonzero(set_.values)):
+        res += np.prod([dist.dists[var].pmf(var.support[i]) for var, i in zip(set_.dimensions, index)])
+    return res
+
+
+class TestIndependentDistribution(unittest.TestCase):
+    def setUp(self):
+        self.A = Variable("A", (False, True))
+        self.B = Variable("B", (0, 1, 2, 3))
+        self.C = Variable("C", (0, 1, 2))
+        self.dist = IndependentDistribution({
+            self.A: stats.bernoulli(0.3),
+            self.B: stats.binom(3, 0.4),
+            self.C: stats.randint(0, 3)
+        })
+        self.rng = np.random.default_rng(0)
+
+    def random_set(self, dimensions):
+        shape = tuple(len(var.support) for var in dimensions)
+        return DiscreteSet(dimensions, self.rng.random(shape) < 0.5)
+
+    def test_pmf(self):
+        for dimensions in [(self.A,), (self.B, self.A), (self.C, self.A, self.B)]:
+            set_ = self.random_set(dimensions)
+            self.assertAlmostEqual(self.dist.pmf(set_), pmf_by_cells(self.dist, set_))
+        full = DiscreteSet((self.A, self.B, self.C), np.full((2, 4, 3), True))
+        self.assertAlmostEqual(self.dist.pmf(full), 1)
+        self.assertEqual(self.dist.pmf(DiscreteSet((), np.array(True))), 1)
+
+    def test_pmf_many(self):
+        sets = [self.random_set(dimensions) for dimensions in
+                [(self.A, self.B), (self.C,), (self.A, self.B), (self.B, self.A)]]
+        res = self.dist.pmf_many(sets)
+        self.assertEqual(res.shape, (4,))
+        for set_, p in zip(sets, res):
+            self.assertAlmostEqual(p, pmf_by_cells(self.dist, set_))
+
+
+if __name__ == '__main__':
+    unittest.main()
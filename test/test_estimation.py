@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+from causality import CausalGraph
+from causality.identification import closed_form
+from causality.estimation import Estimator
+
+
+class TestEstimation(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 20000
+        Z = rng.integers(0, 3, n)
+        X = (rng.random(n) < 0.2 + 0.3 * Z).astype(int)
+        M = (rng.random(n) < 0.3 + 0.5 * X).astype(int)
+        Y = (rng.random(n) < 0.1 + 0.4 * M + 0.1 * Z).astype(int)
+        self.data = np.column_stack([Z, X, M, Y])
+        self.estimator = Estimator(self.data, ["Z", "X", "M", "Y"])
+
+    def manual_back_door(self, x, y):
+        Z, X, M, Y = self.data.T
+        return sum(np.mean(Y[(X == x) & (Z == z)] == y) * np.mean(Z == z) for z in range(3))
+
+    def test_back_door(self):
+        graph = CausalGraph(from_list=[("Z", "X"), ("Z", "Y"), ("X", "M"), ("M", "Y")])
+        # The back-door adjustment comes first, then the front-door one
+        expressions = closed_form(graph, {"X"}, {"Y"})
+        factor = self.estimator.evaluate(expressions[0])
+        self.assertEqual(set(factor.variables), {"X", "Y"})
+        for x in range(2):
+            for y in range(2):
+                self.assertAlmostEqual(factor.get({"X": x, "Y": y}), self.manual_back_door(x, y))
+        # The back-door tables are all contained in P(Y, X, Z)
+        self.assertEqual(len([cols for cols in self.estimator.count_tables if len(cols) == 3]), 1)
+
+    def test_front_door(self):
+        # Z is latent, the effect goes through the front-door M
+        graph = CausalGraph(from_list=[("Z", "X"), ("Z", "Y"), ("X", "M"), ("M", "Y")])
+        expressions = closed_form(graph, {"X"}, {"Y"}, U={"Z"})
+        self.assertEqual(len(expressions), 1)
+        Z, X, M, Y = self.data.T
+        for expression in expressions:
+            factor = self.estimator.evaluate(expression)
+            for x in range(2):
+                expected = sum(
+                    np.mean(M[X == x] == m) * sum(
+                        np.mean(Y[(X == x_) & (M == m)] == 1) * np.mean(X == x_) for x_ in range(2))
+                    for m in range(2))
+                self.assertAlmostEqual(factor.get({"X": x, "Y": 1}), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
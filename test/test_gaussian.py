@@ -0,0 +1,120 @@
+import unittest
+import os
+import tempfile
+from itertools import combinations
+import numpy as np
+from causality.gaussian import GaussianIndependenceTest
+
+
+class TestGaussian(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 500
+        data = rng.normal(size=(n, 6))
+        # Chain V0 -> V1 -> V2, and V3 depends on V0 and V2
+        data[:, 1] += 0.8 * data[:, 0]
+        data[:, 2] += 0.5 * data[:, 1]
+        data[:, 3] += 0.4 * data[:, 0] - 0.7 * data[:, 2]
+        self.data = data
+        self.names = ["V" + str(i) for i in range(6)]
+
+    def all_tests(self):
+        tests = []
+        for i, j in combinations(self.names, 2):
+            others = [k for k in self.names if k not in (i, j)]
+            for size in range(4):
+                tests += [(i, j, K) for K in combinations(others, size)]
+        return tests
+
+    def test_precision_matches_recursive(self):
+        precision = GaussianIndependenceTest(self.data, self.names)
+        recursive = GaussianIndependenceTest(self.data, self.names, method="recursive")
+        tests = self.all_tests()
+        expected = [recursive.indep_test(*test) for test in tests]
+        np.testing.assert_allclose([precision.indep_test(*test) for test in tests], expected, atol=1e-10)
+        np.testing.assert_allclose(precision.indep_test_many(tests), expected, atol=1e-10)
+
+    def test_too_few_samples(self):
+        test = GaussianIndependenceTest(self.data[:6], self.names)
+        test.indep_test_many([("V0", "V1", ["V2", "V3"])])
+        for K in [["V2", "V3", "V4"], ["V2", "V3", "V4", "V5"]]:
+            self.assertRaises(ValueError, test.indep_test_many, [("V0", "V1", []), ("V0", "V1", K)])
+            self.assertRaises(ValueError, test.indep_test, "V0", "V1", K)
+
+    def test_bounded_cache(self):
+        test = GaussianIndependenceTest(self.data, self.names, method="recursive", cache_entries=10)
+        tests = self.all_tests()
+        expected = GaussianIndependenceTest(self.data, self.names).indep_test_many(tests)
+        np.testing.assert_allclose([test.indep_test(*t) for t in tests], expected, atol=1e-10)
+        cache = test.partial_corr_cache
+        self.assertEqual(len(cache), 10)
+        self.assertGreater(cache.evictions, 0)
+        self.assertGreater(cache.hits, 0)
+        # Symmetric tests share their entry
+        hits = cache.hits
+        test.partial_corr("V1", "V0", ["V2", "V3"])
+        test.partial_corr("V0", "V1", ["V3", "V2"])
+        self.assertEqual(cache.hits, hits + 1)
+
+    def test_streaming_construction(self):
+        expected = GaussianIndependenceTest(self.data, self.names)
+        with tempfile.TemporaryDirectory() as directory:
+            npy_path = os.path.join(directory, "data.npy")
+            csv_path = os.path.join(directory, "data.csv")
+            np.save(npy_path, self.data)
+            np.savetxt(csv_path, self.data, delimiter=",", header=",".join(self.names), fmt="%.17g")
+            for source in [npy_path, csv_path, self.data, [self.data[:100], self.data[100:]]]:
+                test = GaussianIndependenceTest.from_chunks(source, self.names, chunk_size=64)
+                self.assertEqual(test.n, expected.n)
+                np.testing.assert_allclose(test.corr_matrix, expected.corr_matrix, atol=1e-12)
+
+        # Merging more data later gives the statistics of the whole data
+        test = GaussianIndependenceTest(self.data[:200], self.names)
+        test.indep_test("V0", "V2", ["V1"])
+        test.update(self.data[200:], chunk_size=50)
+        np.testing.assert_allclose(test.corr_matrix, np.corrcoef(self.data, rowvar=False), atol=1e-12)
+        self.assertAlmostEqual(test.indep_test("V0", "V2", ["V1"]), expected.indep_test("V0", "V2", ["V1"]))
+
+    def test_p_value_bounds(self):
+        test = GaussianIndependenceTest(self.data[:200], self.names)
+        bounds = test.p_value_bounds()
+        tests = self.all_tests()
+        bounds.track(list(range(len(tests))), tests)
+        bounds.discard(range(0, len(tests), 2))
+        for end in [220, 260, 500]:
+            test.update(self.data[test.n:end])
+            keys, low, high = bounds.bounds()
+            self.assertEqual(sorted(keys), list(range(1, len(tests), 2)))
+            p_values = test.indep_test_many([tests[key] for key in keys])
+            self.assertTrue(np.all((low <= p_values + 1e-12) & (p_values <= high + 1e-12)))
+            # The bounds tighten once a test is computed again
+            bounds.track(keys[:5], [tests[key] for key in keys[:5]])
+            _, low, high = bounds.bounds()
+            np.testing.assert_allclose(low[:5], p_values[:5], atol=1e-12)
+            np.testing.assert_allclose(high[:5], p_values[:5], atol=1e-12)
+
+    def test_lazy_correlation(self):
+        dense = GaussianIndependenceTest(self.data, self.names)
+        tests = self.all_tests()
+        expected = [dense.indep_test(*test) for test in tests]
+        with tempfile.TemporaryDirectory() as directory:
+            npy_path = os.path.join(directory, "data.npy")
+            np.save(npy_path, self.data)
+            for source in [self.data, npy_path]:
+                # Blocks of 2 columns, and a cache too small to hold them all
+                lazy = GaussianIndependenceTest.lazy(source, self.names, block_size=2, max_blocks=3, chunk_size=64)
+                np.testing.assert_allclose(lazy.corr_matrix[np.arange(6)[:, None], np.arange(6)],
+                                           dense.corr_matrix, atol=1e-12)
+                lazy.prefetch([["V0", "V1", "V2"]])
+                np.testing.assert_allclose([lazy.indep_test(*test) for test in tests], expected, atol=1e-10)
+                np.testing.assert_allclose(lazy.indep_test_many(tests), expected, atol=1e-10)
+                self.assertRaises(TypeError, lazy.update, self.data)
+
+        # Unbounded cache
+        lazy = GaussianIndependenceTest.lazy(self.data, self.names, block_size=2, max_blocks=None)
+        lazy.prefetch([self.names])
+        np.testing.assert_allclose(lazy.indep_test_many(tests), expected, atol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
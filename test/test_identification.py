@@ -0,0 +1,88 @@
+import unittest
+from random import Random
+from itertools import combinations
+from causality import CausalGraph
+from causality.identification import blocking_set, back_door_criterion, \
+    all_minimal_adjustment_sets, iter_minimal_adjustment_sets, closed_form, \
+    IdentificationContext
+
+
+def random_dag(n_nodes, n_edges, seed):
+    rng = Random(seed)
+    nodes = ["V" + str(i) for i in range(n_nodes)]
+    edges = list(combinations(nodes, 2))
+    rng.shuffle(edges)
+    graph = CausalGraph()
+    for node in nodes:
+        graph.add_node(node)
+    for begin, end in edges[:n_edges]:
+        graph.add_edge(begin, end)
+    return graph, rng
+
+
+class TestIdentification(unittest.TestCase):
+    def test_blocking_set(self):
+        for seed in range(30):
+            graph, rng = random_dag(10, 18, seed)
+            x, y = rng.sample(graph.nodes(), 2)
+            X, Y = {x}, {y}
+            U = set(rng.sample([n for n in graph.nodes() if n not in (x, y)], 2))
+            Z = blocking_set(graph, X, Y, U)
+            if Z is None:
+                # Even all the allowed ancestors do not separate X and Y
+                allowed = graph.ancestors(X.union(Y)).difference(U, X, Y)
+                self.assertFalse(graph.is_d_separated(X, Y, allowed))
+            else:
+                self.assertTrue(Z.isdisjoint(U))
+                self.assertTrue(graph.is_d_separated(X, Y, Z))
+                for z in Z:
+                    self.assertFalse(graph.is_d_separated(X, Y, Z.difference({z})))
+
+    def test_minimal_adjustment_sets(self):
+        for seed in range(40):
+            graph, rng = random_dag(8, 13, seed)
+            x, y = rng.sample(graph.nodes(), 2)
+            X, Y = {x}, {y}
+            U = set(rng.sample([n for n in graph.nodes() if n not in (x, y)], 1))
+            candidates = set(graph.nodes()).difference(X, Y, U)
+            valid = [frozenset(Z) for k in range(len(candidates) + 1)
+                     for Z in combinations(candidates, k)
+                     if back_door_criterion(graph, X, Y, Z)]
+            expected = {Z for Z in valid if not any(other < Z for other in valid)}
+            self.assertEqual(all_minimal_adjustment_sets(graph, X, Y, U), expected)
+
+    def test_enumeration_limits(self):
+        # X <- Ai -> Bi -> Y for i = 0..3: each path is blocked by Ai or Bi,
+        # so there are 2^4 minimal adjustment sets
+        graph = CausalGraph()
+        graph.add_edge("X", "Y")
+        for i in range(4):
+            graph.add_edge("A" + str(i), "X")
+            graph.add_edge("A" + str(i), "B" + str(i))
+            graph.add_edge("B" + str(i), "Y")
+        self.assertEqual(len(all_minimal_adjustment_sets(graph, {"X"}, {"Y"})), 16)
+        self.assertEqual(len(list(iter_minimal_adjustment_sets(graph, {"X"}, {"Y"}, max_sets=3))), 3)
+        self.assertEqual(len(closed_form(graph, {"X"}, {"Y"}, max_sets=5)), 5)
+
+    def test_identification_context(self):
+        graph, rng = random_dag(8, 14, 3)
+        context = IdentificationContext()
+        for x in graph.nodes():
+            for y in graph.nodes():
+                if x != y:
+                    expected = [str(e) for e in closed_form(graph, {x}, {y})]
+                    result = [str(e) for e in closed_form(graph, {x}, {y}, context=context)]
+                    self.assertEqual(result, expected)
+        self.assertGreater(sum(context.hits.values()), 0)
+        # Modifying the graph invalidates the cached results
+        misses = context.misses["closed_form"]
+        x, y = graph.nodes()[:2]
+        closed_form(graph, {x}, {y}, context=context)
+        self.assertEqual(context.misses["closed_form"], misses)
+        graph.add_edge(x, "new node")
+        closed_form(graph, {x}, {y}, context=context)
+        self.assertEqual(context.misses["closed_form"], misses + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import os
+import random
+import tempfile
+from causality.random_system import generate_linear_system, sample_linear_system
+from causality.gaussian import GaussianIndependenceTest
+from causality.discovery import pc_algorithm, pc_algorithm_sweep
+from causality.pvalue_store import PValueStore, CachedIndependenceTest, fingerprint
+
+
+class TestPValueStore(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+        graph = generate_linear_system(
+            n_nodes=7, n_edges=9,
+            min_mu=0, max_mu=0,
+            min_sigma=0.5, max_sigma=1,
+            min_rho=0.5, max_rho=1
+        )
+        self.data = sample_linear_system(graph, 1000)
+        self.names = ["V" + str(i) for i in range(self.data.shape[1])]
+        self.test = GaussianIndependenceTest(self.data, self.names)
+
+    def test_sweep(self):
+        alphas = [0.001, 0.01, 0.05, 0.2]
+        for stable in [False, True]:
+            cached = CachedIndependenceTest(self.test)
+            graphs = pc_algorithm_sweep(self.data, cached, alphas, stable=stable)
+            self.assertEqual(list(graphs), alphas)
+            for alpha in alphas:
+                expected = pc_algorithm(self.data, self.test, alpha, stable=stable)
+                self.assertEqual(sorted(graphs[alpha].edges()), sorted(expected.edges()))
+            # A second sweep only reads the store
+            misses = cached.misses
+            pc_algorithm_sweep(self.data, cached, alphas, stable=stable)
+            self.assertEqual(cached.misses, misses)
+
+    def test_persistent_store(self):
+        key = fingerprint(self.data)
+        self.assertNotEqual(key, fingerprint(self.data[1:]))
+        tests = [("V0", "V1", []), ("V2", "V3", ["V0", "V1"])]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "pvalues.sqlite")
+            with PValueStore(path, key) as store:
+                cached = CachedIndependenceTest(self.test, store)
+                expected = cached.indep_test_many(tests)
+                self.assertEqual(cached.misses, 2)
+
+            with PValueStore(path, key) as store:
+                self.assertEqual(len(store), 2)
+                # Symmetric in x and y, and in any order of Z
+                self.assertEqual(store.get("V3", "V2", ["V1", "V0"]), expected[1])
+                cached = CachedIndependenceTest(self.test, store)
+                self.assertEqual(list(cached.indep_test_many(tests)), list(expected))
+                self.assertEqual((cached.hits, cached.misses), (2, 0))
+
+            with PValueStore(path, "other data") as store:
+                self.assertEqual(len(store), 0)
+
+    def test_batched_writes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "pvalues.sqlite")
+            with PValueStore(path, "data", commit_every=3) as store:
+                store.put_many([("V0", "V1", []), ("V0", "V2", [])], [0.1, 0.2])
+                # Buffered until commit_every p-values are pending
+                with PValueStore(path, "data") as reader:
+                    self.assertEqual(len(reader), 0)
+                store.put_many([("V1", "V2", [])], [0.3])
+                with PValueStore(path, "data") as reader:
+                    self.assertEqual(len(reader), 3)
+                store.put_many([("V0", "V3", [])], [0.4])
+                store.flush()
+                with PValueStore(path, "data") as reader:
+                    self.assertEqual(len(reader), 4)
+                store.put_many([("V1", "V3", [])], [0.5])
+            with PValueStore(path, "data") as reader:
+                self.assertEqual(len(reader), 5)
+
+            # pc_algorithm writes the p-values at the end of every level
+            with PValueStore(path, "pc") as store:
+                pc_algorithm(self.data, CachedIndependenceTest(self.test, store), 0.05)
+                with PValueStore(path, "pc") as reader:
+                    self.assertEqual(len(reader), len(store))
+
+
+if __name__ == '__main__':
+    unittest.main()